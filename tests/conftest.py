@@ -1,5 +1,7 @@
 import os
 
+import pytest
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 root_dir_content = os.listdir(BASE_DIR)
 PROJECT_DIR_NAME = 'yatube'
@@ -37,3 +39,14 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(autouse=True)
+def isolated_settings(settings, tmp_path):
+    """Кэш и каталог показателей только для тестов, как в TestCase проекта."""
+    from posts.tests.utils import TEST_SETTINGS, remove_test_files
+
+    settings.CACHES = TEST_SETTINGS['CACHES']
+    settings.METRICS_DIR = str(tmp_path / 'metrics')
+    yield
+    remove_test_files()
@@ -0,0 +1,265 @@
+import math
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import get_context
+from socket import create_server
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.middleware.csrf import _get_new_csrf_token
+from django.test import Client
+from django.urls import reverse
+
+from posts.models import Follow, Group, Post
+
+User = get_user_model()
+
+# Сколько последних постов, групп и читателей берется в выборку.
+POOL_SIZE = 200
+READERS = 20
+QUERIES_HEADER = 'X-Queries'
+COMMENT_TEXT = 'Комментарий нагрузочного теста'
+
+Request = namedtuple('Request', 'method path data user')
+Sample = namedtuple('Sample', 'latency status queries')
+
+
+class QueryCounter:
+    '''Обертка для execute_wrapper, считающая запросы к базе.'''
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def counting_queries(application):
+    '''WSGI-обертка, сообщающая число запросов в заголовке X-Queries.'''
+    def wrapper(environ, start_response):
+        counter = QueryCounter()
+
+        def start(status, headers, exc_info=None):
+            headers.append((QUERIES_HEADER, str(counter.count)))
+            return start_response(status, headers, exc_info)
+
+        with connection.execute_wrapper(counter):
+            return application(environ, start)
+    return wrapper
+
+
+def login_session(username):
+    '''Ключ сессии, в которой пользователь уже вошел на сайт.'''
+    client = Client()
+    client.force_login(User.objects.get(username=username))
+    return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+
+class Dataset:
+    '''Выборка существующих объектов, к которым обращаются сценарии.'''
+
+    def __init__(self, rng, password):
+        self.rng = rng
+        self.password = password
+        posts = Post.objects.order_by('-pk').values_list(
+            'pk', 'author__username')[:POOL_SIZE]
+        self.post_ids = [pk for pk, _ in posts]
+        self.authors = sorted({username for _, username in posts})
+        self.groups = list(Group.objects.order_by('pk').values_list(
+            'slug', flat=True)[:POOL_SIZE])
+        self.readers = list(Follow.objects.order_by('user_id').values_list(
+            'user__username', flat=True).distinct()[:READERS])
+        self.sessions = {username: login_session(username)
+                         for username in self.readers}
+
+    def missing(self):
+        '''Виды объектов, которых нет в базе.'''
+        pools = {'posts': self.post_ids, 'groups': self.groups,
+                 'follows': self.readers}
+        return [name for name, pool in pools.items() if not pool]
+
+    def pick(self, pool):
+        return self.rng.choice(pool)
+
+
+def index(data):
+    return Request('GET', reverse('posts:index'), None, None)
+
+
+def group_posts(data):
+    return Request('GET', reverse('posts:group_posts',
+                                  args=[data.pick(data.groups)]), None, None)
+
+
+def profile(data):
+    return Request('GET', reverse('posts:profile',
+                                  args=[data.pick(data.authors)]), None, None)
+
+
+def post_detail(data):
+    return Request('GET', reverse('posts:post_detail',
+                                  args=[data.pick(data.post_ids)]), None, None)
+
+
+def follow_index(data):
+    return Request('GET', reverse('posts:follow_index'), None,
+                   data.pick(data.readers))
+
+
+def add_comment(data):
+    return Request('POST', reverse('posts:add_comment',
+                                   args=[data.pick(data.post_ids)]),
+                   {'text': COMMENT_TEXT}, data.pick(data.readers))
+
+
+def login(data):
+    return Request('POST', reverse('users:login'),
+                   {'username': data.pick(data.readers),
+                    'password': data.password}, None)
+
+
+SCENARIOS = {
+    'index': index,
+    'group_posts': group_posts,
+    'profile': profile,
+    'post_detail': post_detail,
+    'follow_index': follow_index,
+    'add_comment': add_comment,
+    'login': login,
+}
+
+
+class ClientRunner:
+    '''Запросы в текущем процессе через тестовый клиент Django.'''
+    concurrency = 1
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.token = _get_new_csrf_token()
+
+    def send(self, request):
+        client = Client(HTTP_X_CSRFTOKEN=self.token)
+        client.cookies[settings.CSRF_COOKIE_NAME] = self.token
+        if request.user:
+            client.cookies[settings.SESSION_COOKIE_NAME] = (
+                self.dataset.sessions[request.user])
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            if request.method == 'POST':
+                response = client.post(request.path, request.data)
+            else:
+                response = client.get(request.path)
+        return Sample(time.perf_counter() - started, response.status_code,
+                      counter.count)
+
+    def close(self):
+        pass
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(listener):
+    '''Обслуживает общий слушающий сокет в дочернем процессе.'''
+    server = WSGIServer(listener.getsockname(), QuietHandler,
+                        bind_and_activate=False)
+    server.socket.close()
+    server.socket = listener
+    server.server_name, server.server_port = listener.getsockname()
+    server.setup_environ()
+    server.set_app(counting_queries(get_wsgi_application()))
+    server.serve_forever()
+
+
+class ServerRunner:
+    '''
+    Запросы по HTTP к нескольким процессам wsgiref, которые принимают
+    соединения с одного сокета. Нагрузку создают concurrency потоков.
+    '''
+
+    def __init__(self, dataset, workers, concurrency):
+        self.dataset = dataset
+        self.concurrency = concurrency
+        self.token = _get_new_csrf_token()
+        self.local = threading.local()
+        self.listener = create_server(('127.0.0.1', 0), backlog=128)
+        self.url = 'http://127.0.0.1:{}'.format(
+            self.listener.getsockname()[1])
+        # Соединения с базой не должны достаться дочерним процессам.
+        connections.close_all()
+        context = get_context('fork')
+        self.workers = [context.Process(target=serve, args=(self.listener,),
+                                        daemon=True)
+                        for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def send(self, request):
+        cookies = {settings.CSRF_COOKIE_NAME: self.token}
+        if request.user:
+            cookies[settings.SESSION_COOKIE_NAME] = (
+                self.dataset.sessions[request.user])
+        started = time.perf_counter()
+        response = self.session().request(
+            request.method, self.url + request.path, data=request.data,
+            cookies=cookies, headers={'X-CSRFToken': self.token},
+            allow_redirects=False)
+        return Sample(time.perf_counter() - started, response.status_code,
+                      int(response.headers.get(QUERIES_HEADER, 0)))
+
+    def close(self):
+        for worker in self.workers:
+            worker.terminate()
+            worker.join()
+        self.listener.close()
+
+
+def percentile(values, percent):
+    '''Процентиль по методу ближайшего ранга.'''
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def summarize(samples, elapsed):
+    latencies = [sample.latency * 1000 for sample in samples]
+    return {
+        'requests': len(samples),
+        'errors': sum(sample.status >= 400 for sample in samples),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'queries': round(
+            sum(sample.queries for sample in samples) / len(samples), 1),
+        'throughput_rps': round(len(samples) / elapsed, 1),
+    }
+
+
+def measure(runner, scenario, count, warmup):
+    '''Прогонит сценарий count раз после warmup разогревающих запросов.'''
+    for _ in range(warmup):
+        runner.send(scenario(runner.dataset))
+    planned = [scenario(runner.dataset) for _ in range(count)]
+    started = time.perf_counter()
+    if runner.concurrency == 1:
+        samples = list(map(runner.send, planned))
+    else:
+        with ThreadPoolExecutor(runner.concurrency) as executor:
+            samples = list(executor.map(runner.send, planned))
+    return summarize(samples, time.perf_counter() - started)
@@ -0,0 +1,71 @@
+from django.core.cache.backends import db
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import router, transaction
+from django.utils.module_loading import import_string
+
+from . import metrics, tracing
+
+_missing = object()
+
+
+class DatabaseCache(db.DatabaseCache):
+    '''
+    Кэш в таблице базы данных, который записывает set_many одной
+    транзакцией: иначе каждый ключ фиксируется в SQLite отдельно.
+    '''
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        using = router.db_for_write(self.cache_model_class)
+        with transaction.atomic(using=using):
+            return super().set_many(data, timeout, version)
+
+
+class InstrumentedCache:
+    '''
+    Обертка над бэкендом кэша из параметра INNER_BACKEND: считает
+    попадания и промахи текущего запроса и добавляет обращения в его
+    трассировку. Остальные методы передаются бэкенду без изменений.
+    '''
+
+    def __init__(self, location, params):
+        params = dict(params)
+        backend = import_string(params.pop('INNER_BACKEND'))
+        self._cache = backend(location, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def get(self, key, default=None, version=None):
+        with tracing.span('cache.get', 'cache', key=key) as args:
+            value = self._cache.get(key, _missing, version)
+            hit = value is not _missing
+            if args is not None:
+                args['hit'] = hit
+        metrics.count_cache(int(hit), int(not hit))
+        return value if hit else default
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        with tracing.span('cache.get_many', 'cache', keys=len(keys)):
+            found = self._cache.get_many(keys, version)
+        metrics.count_cache(len(found), len(keys) - len(found))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with tracing.span('cache.set', 'cache', key=key):
+            self._cache.set(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        with tracing.span('cache.set_many', 'cache', keys=len(data)):
+            return self._cache.set_many(data, timeout, version)
+
+    def delete(self, key, version=None):
+        with tracing.span('cache.delete', 'cache', key=key):
+            self._cache.delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        with tracing.span('cache.delete_many', 'cache'):
+            self._cache.delete_many(keys, version)
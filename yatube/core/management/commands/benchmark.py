@@ -0,0 +1,123 @@
+import json
+import os
+import random
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import benchmark
+from posts.models import Comment, Post, User
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def change(old, new):
+    if not old:
+        return ''
+    return f' ({(new - old) / old:+.0%})'
+
+
+class Command(BaseCommand):
+    help = ('Измерит задержки, число запросов к базе и пропускную '
+            'способность представлений на текущих данных (их можно создать '
+            'командой generate_dataset). Сценарий add_comment пишет в базу.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode', choices=['client', 'server'], default='client',
+            help='client — тестовый клиент в этом процессе, server — HTTP к '
+                 'нескольким процессам wsgiref.')
+        parser.add_argument(
+            '--view', action='append', choices=list(benchmark.SCENARIOS),
+            help='Измерить только эти представления.')
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Сколько запросов к каждому представлению.')
+        parser.add_argument(
+            '--warmup', type=int, default=10,
+            help='Сколько запросов сделать перед замером.')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов сервера в режиме server.')
+        parser.add_argument(
+            '--concurrency', type=int, default=8,
+            help='Число одновременных клиентов в режиме server.')
+        parser.add_argument(
+            '--password', default='password',
+            help='Пароль пользователей для сценария login.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--output', help='Сохранить результаты в этот JSON-файл.')
+        parser.add_argument(
+            '--compare', help='Сравнить с результатами из этого JSON-файла.')
+
+    def handle(self, *args, **options):
+        dataset = benchmark.Dataset(random.Random(options['seed']),
+                                    options['password'])
+        missing = dataset.missing()
+        if missing:
+            raise CommandError(
+                'Для замеров не хватает данных: {}. Создайте их командой '
+                'generate_dataset.'.format(', '.join(missing)))
+        if options['mode'] == 'server':
+            runner = benchmark.ServerRunner(
+                dataset, options['workers'], options['concurrency'])
+        else:
+            runner = benchmark.ClientRunner(dataset)
+        views = {}
+        try:
+            for name in options['view'] or benchmark.SCENARIOS:
+                views[name] = benchmark.measure(
+                    runner, benchmark.SCENARIOS[name], options['requests'],
+                    options['warmup'])
+                self.report(name, views[name])
+        finally:
+            runner.close()
+        results = {
+            'commit': current_commit(),
+            'created': timezone.now().isoformat(),
+            'mode': options['mode'],
+            'workers': options['workers'] if runner.concurrency > 1 else 1,
+            'concurrency': runner.concurrency,
+            'dataset': {'users': User.objects.count(),
+                        'posts': Post.objects.count(),
+                        'comments': Comment.objects.count()},
+            'views': views,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+        if options['compare']:
+            self.compare(options['compare'], views)
+
+    def report(self, name, stats):
+        self.stdout.write(
+            f'{name:<13} p50 {stats["p50_ms"]:8.2f} мс  '
+            f'p95 {stats["p95_ms"]:8.2f} мс  p99 {stats["p99_ms"]:8.2f} мс  '
+            f'запросов к БД {stats["queries"]:5.1f}  '
+            f'{stats["throughput_rps"]:7.1f} запр./с  '
+            f'ошибок {stats["errors"]}')
+
+    def compare(self, path, views):
+        with open(path) as previous:
+            baseline = json.load(previous)
+        self.stdout.write(f'Сравнение с {baseline.get("commit") or path}:')
+        for name, stats in views.items():
+            old = baseline['views'].get(name)
+            if not old:
+                continue
+            self.stdout.write(
+                f'{name:<13} p95 {old["p95_ms"]:.2f} -> {stats["p95_ms"]:.2f}'
+                f' мс{change(old["p95_ms"], stats["p95_ms"])}  '
+                f'{old["throughput_rps"]:.1f} -> '
+                f'{stats["throughput_rps"]:.1f} запр./с'
+                f'{change(old["throughput_rps"], stats["throughput_rps"])}')
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import BaseDatabaseCache
+from django.core.management.commands import createcachetable
+
+from core.cache import InstrumentedCache
+
+
+class Command(createcachetable.Command):
+    '''
+    createcachetable, который находит таблицы и у бэкендов базы данных за
+    оберткой core.cache.InstrumentedCache. Django вызывает эту команду и
+    при создании тестовой базы.
+    '''
+
+    def handle(self, *tablenames, **options):
+        if not tablenames:
+            tablenames = []
+            for alias in settings.CACHES:
+                cache = caches[alias]
+                if isinstance(cache, InstrumentedCache):
+                    cache = cache._cache
+                if isinstance(cache, BaseDatabaseCache):
+                    tablenames.append(cache._table)
+        super().handle(*tablenames, **options)
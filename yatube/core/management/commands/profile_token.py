@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import profiling
+
+
+class Command(BaseCommand):
+    help = ('Выдаст значение заголовка X-Profile, по которому запрос '
+            'будет профилирован.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode', choices=list(profiling.PROFILERS), default='sampler',
+            help='sampler — свернутые стеки для flamegraph, cprofile — '
+                 'файл pstats.')
+
+    def handle(self, *args, **options):
+        token = profiling.make_token(options['mode'])
+        self.stdout.write(token)
+        self.stderr.write(
+            f'Действует {settings.PROFILE_TOKEN_MAX_AGE} с, например: '
+            f'curl -H "X-Profile: {token}" http://127.0.0.1:8000/')
@@ -0,0 +1,192 @@
+import atexit
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+                    10)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576)
+
+# Сумма по всем запросам к представлению: (имя, описание).
+TOTALS = (
+    ('db_queries', 'Запросы к базе данных.'),
+    ('db_seconds', 'Время запросов к базе данных.'),
+    ('cache_hits', 'Попадания в кэш.'),
+    ('cache_misses', 'Промахи кэша.'),
+    ('template_seconds', 'Время отрисовки шаблонов.'),
+)
+HISTOGRAMS = (
+    ('duration', DURATION_BUCKETS, 'request_duration_seconds',
+     'Время обработки запроса.'),
+    ('size', SIZE_BUCKETS, 'response_size_bytes', 'Размер ответа.'),
+)
+PREFIX = 'yatube_'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Показатели запроса, который сейчас обрабатывается.
+current = ContextVar('metrics', default=None)
+
+
+class RequestMetrics:
+    '''Показатели одного запроса, которые собирают обертки.'''
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_seconds = 0.0
+        self.rendering = 0
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_seconds += time.perf_counter() - started
+
+
+def count_cache(hits, misses):
+    metrics = current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+def empty_view():
+    view = {name: 0 for name, _ in TOTALS}
+    view['statuses'] = {}
+    for name, buckets, _, _ in HISTOGRAMS:
+        view[name] = {'buckets': [0] * len(buckets), 'sum': 0, 'count': 0}
+    return view
+
+
+def observe_histogram(histogram, buckets, value):
+    histogram['sum'] += value
+    histogram['count'] += 1
+    for index, bound in enumerate(buckets):
+        if value <= bound:
+            histogram['buckets'][index] += 1
+
+
+class Registry:
+    '''
+    Показатели процесса по именам представлений. Периодически
+    сохраняются в файл процесса в settings.METRICS_DIR, откуда их
+    собирает /metrics любого из процессов.
+    '''
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.views = {}
+        self.flushed = 0
+
+    def observe(self, view, status, duration, size, metrics):
+        with self.lock:
+            data = self.views.setdefault(view, empty_view())
+            for name, _ in TOTALS:
+                data[name] += getattr(metrics, name)
+            data['statuses'][str(status)] = (
+                data['statuses'].get(str(status), 0) + 1)
+            observe_histogram(data['duration'], DURATION_BUCKETS, duration)
+            if size is not None:
+                observe_histogram(data['size'], SIZE_BUCKETS, size)
+        if time.monotonic() - self.flushed > settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if not self.views:
+            return
+        directory = settings.METRICS_DIR
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{self.pid}.json')
+        with self.lock:
+            with open(path + '.tmp', 'w') as output:
+                json.dump(self.views, output)
+            os.replace(path + '.tmp', path)
+            self.flushed = time.monotonic()
+
+
+_registry = None
+
+
+def registry():
+    '''Реестр текущего процесса; после fork создается заново.'''
+    global _registry
+    if _registry is None or _registry.pid != os.getpid():
+        _registry = Registry()
+        atexit.register(_registry.flush)
+    return _registry
+
+
+def merge(target, source):
+    for name, value in source.items():
+        if isinstance(value, dict):
+            merge(target.setdefault(name, {}), value)
+        elif isinstance(value, list):
+            target[name] = [a + b for a, b in zip(target[name], value)]
+        else:
+            target[name] = target.get(name, 0) + value
+
+
+def collect():
+    '''Показатели всех процессов, сложенные по представлениям.'''
+    registry().flush()
+    views = {}
+    directory = settings.METRICS_DIR
+    if not os.path.isdir(directory):
+        return views
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as source:
+                process_views = json.load(source)
+        except (OSError, ValueError):
+            continue
+        for view, data in process_views.items():
+            merge(views.setdefault(view, empty_view()), data)
+    return views
+
+
+def escape(value):
+    return (value.replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+def render(views):
+    '''Показатели в текстовом формате Prometheus.'''
+    lines = []
+    name = PREFIX + 'requests_total'
+    lines += [f'# HELP {name} Обработанные запросы.',
+              f'# TYPE {name} counter']
+    for view, data in sorted(views.items()):
+        for status, count in sorted(data['statuses'].items()):
+            lines.append(
+                f'{name}{{view="{escape(view)}",status="{status}"}} {count}')
+    for key, buckets, suffix, description in HISTOGRAMS:
+        name = PREFIX + suffix
+        lines += [f'# HELP {name} {description}',
+                  f'# TYPE {name} histogram']
+        for view, data in sorted(views.items()):
+            histogram = data[key]
+            label = f'view="{escape(view)}"'
+            for bound, count in zip(buckets, histogram['buckets']):
+                lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+            lines += [
+                f'{name}_bucket{{{label},le="+Inf"}} {histogram["count"]}',
+                f'{name}_sum{{{label}}} {histogram["sum"]}',
+                f'{name}_count{{{label}}} {histogram["count"]}',
+            ]
+    for key, description in TOTALS:
+        name = f'{PREFIX}{key}_total'
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} counter']
+        lines += [f'{name}{{view="{escape(view)}"}} {data[key]}'
+                  for view, data in sorted(views.items())]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,85 @@
+import os
+import time
+
+from django.db import connection
+
+from . import metrics, profiling, tracing
+
+
+class MetricsMiddleware:
+    '''
+    Собирает по имени представления время ответа, число и время запросов
+    к базе, попадания в кэш, время отрисовки шаблонов и размер ответа.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(request_metrics.execute):
+                response = self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        size = None if response.streaming else len(response.content)
+        metrics.registry().observe(
+            match.view_name if match else 'unresolved',
+            response.status_code, duration, size, request_metrics)
+        return response
+
+
+class TracingMiddleware:
+    '''
+    Трассирует долю settings.TRACE_SAMPLE_RATE запросов: запросы к базе,
+    кэшу, отрисовку шаблонов и создание миниатюр. Каждая трассировка
+    сохраняется в формате Chrome trace в settings.TRACE_DIR.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not tracing.sampled():
+            return self.get_response(request)
+        trace = tracing.Trace()
+        token = tracing.current.set(trace)
+        try:
+            with tracing.span('request', 'view', path=request.path) as args:
+                with connection.execute_wrapper(tracing.execute):
+                    response = self.get_response(request)
+                args['status'] = response.status_code
+        finally:
+            tracing.current.reset(token)
+        match = request.resolver_match
+        trace.save(match.view_name if match else 'unresolved')
+        return response
+
+
+class ProfilingMiddleware:
+    '''
+    Профилирует запрос по подписанному заголовку X-Profile или долю
+    settings.PROFILE_SAMPLE_RATE запросов и сохраняет результат с именем
+    представления в settings.PROFILE_DIR. По заголовку имя файла
+    возвращается в X-Profile-File.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = profiling.requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+        with profiling.PROFILERS[mode]() as profiler:
+            response = self.get_response(request)
+        match = request.resolver_match
+        path = profiling.save(
+            profiler, match.view_name if match else 'unresolved')
+        if profiling.HEADER in request.META:
+            response['X-Profile-File'] = os.path.basename(path)
+        return response
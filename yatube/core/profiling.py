@@ -0,0 +1,131 @@
+import cProfile
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+
+SALT = 'core.profiling'
+HEADER = 'HTTP_X_PROFILE'
+
+
+class StackSampler:
+    '''
+    Раз в interval секунд снимает стек потока thread_id. Результат — число
+    снимков на каждый стек в свернутом формате flamegraph.pl и speedscope.
+    '''
+    extension = 'collapsed'
+
+    def __init__(self, thread_id=None, interval=None):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval or settings.PROFILE_INTERVAL
+        self.stacks = Counter()
+        self.labels = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[self.collapse(frame)] += 1
+
+    def label(self, code):
+        if code not in self.labels:
+            self.labels[code] = '{} ({}:{})'.format(
+                code.co_name, short_path(code.co_filename),
+                code.co_firstlineno)
+        return self.labels[code]
+
+    def collapse(self, frame):
+        '''Стек от корня к frame через точку с запятой.'''
+        labels = []
+        while frame is not None:
+            labels.append(self.label(frame.f_code))
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
+
+    def save(self, path):
+        with open(path, 'w') as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f'{stack} {count}\n')
+
+
+class Profiler:
+    '''cProfile; результат — файл pstats для snakeviz, flameprof и т.п.'''
+    extension = 'prof'
+
+    def __enter__(self):
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+
+    def save(self, path):
+        self.profile.dump_stats(path)
+
+
+PROFILERS = {
+    'sampler': StackSampler,
+    'cprofile': Profiler,
+}
+
+
+def short_path(filename):
+    '''Путь файла относительно проекта или каталога из sys.path.'''
+    roots = [settings.BASE_DIR] + sorted(
+        (path for path in sys.path if path), key=len, reverse=True)
+    for root in roots:
+        if filename.startswith(root + os.sep):
+            return os.path.relpath(filename, root)
+    return filename
+
+
+def make_token(mode):
+    '''Подписанное значение заголовка X-Profile для профилировщика mode.'''
+    return signing.TimestampSigner(salt=SALT).sign(mode)
+
+
+def requested_mode(request):
+    '''
+    Профилировщик для запроса: из подписанного заголовка X-Profile, не
+    старше settings.PROFILE_TOKEN_MAX_AGE секунд, или settings.PROFILE_MODE
+    для доли settings.PROFILE_SAMPLE_RATE запросов. None — не профилировать.
+    '''
+    token = request.META.get(HEADER)
+    if token:
+        try:
+            mode = signing.TimestampSigner(salt=SALT).unsign(
+                token, max_age=settings.PROFILE_TOKEN_MAX_AGE)
+        except signing.BadSignature:
+            return None
+        return mode if mode in PROFILERS else None
+    if random.random() < settings.PROFILE_SAMPLE_RATE:
+        return settings.PROFILE_MODE
+    return None
+
+
+def save(profiler, label):
+    '''Сохранит результат в settings.PROFILE_DIR; вернет путь к файлу.'''
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    filename = '{}-{}-{}.{}'.format(
+        time.strftime('%Y%m%d-%H%M%S'), label.replace(':', '.'),
+        uuid.uuid4().hex[:8], profiler.extension)
+    path = os.path.join(settings.PROFILE_DIR, filename)
+    profiler.save(path)
+    return path
@@ -0,0 +1,38 @@
+import time
+
+from django.template.backends.django import DjangoTemplates, Template
+
+from . import metrics, tracing
+
+
+class TimedTemplate(Template):
+    '''
+    Шаблон, добавляющий время отрисовки к показателям запроса и спан
+    отрисовки в его трассировку.
+    '''
+
+    def render(self, context=None, request=None):
+        with tracing.span('render', 'template',
+                          template=self.origin.template_name):
+            return self._timed_render(context, request)
+
+    def _timed_render(self, context, request):
+        request_metrics = metrics.current.get()
+        if request_metrics is None or request_metrics.rendering:
+            return super().render(context, request)
+        request_metrics.rendering += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            request_metrics.rendering -= 1
+            request_metrics.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
@@ -1,5 +1,27 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from types import SimpleNamespace
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase, Client
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django import test
+from django.test import Client, override_settings
+from django.utils.module_loading import import_string
+
+from core import metrics, profiling, tracing
+from core.benchmark import SCENARIOS
+from core.cache import InstrumentedCache
+from posts import thumbnails
+from posts.models import Follow, Group, Post
+from posts.tests.utils import TestCase, small_gif
 
 
 User = get_user_model()
@@ -13,3 +35,215 @@ class PostsTests(TestCase):
         """404 использует кастомный шаблон."""
         response = self.guest.get('/notexistingpage/')
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+# Проверяет кэш из настроек сайта, поэтому без TEST_SETTINGS.
+class SharedCacheTest(test.TestCase):
+    def test_other_process_sees_invalidation(self):
+        """Сброс из другого процесса (команды управления) виден сайту."""
+        conf = dict(settings.CACHES['default'])
+        other_process = import_string(conf.pop('BACKEND'))(
+            conf.pop('LOCATION'), conf)
+        cache.set('shared', 1)
+        self.assertEqual(other_process.get('shared'), 1)
+        other_process.delete('shared')
+        self.assertIsNone(cache.get('shared'))
+        cache.set_many({'first': 1, 'second': 2})
+        self.assertEqual(other_process.get_many(['first', 'second']),
+                         {'first': 1, 'second': 2})
+
+
+class BenchmarkCommandTest(TestCase):
+    def test_requires_dataset(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark', stdout=StringIO())
+
+    def test_reports_every_view(self):
+        author = User.objects.create_user(username='author')
+        reader = User.objects.create_user(username='reader',
+                                          password='secret')
+        group = Group.objects.create(title='Группа', slug='group',
+                                     description='Описание')
+        Post.objects.create(author=author, group=group, text='Пост')
+        Follow.objects.create(user=reader, author=author)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            call_command('benchmark', '--requests=3', '--warmup=1',
+                         '--password=secret', f'--output={path}',
+                         stdout=StringIO())
+            with open(path) as output:
+                results = json.load(output)
+        self.assertEqual(list(results['views']), list(SCENARIOS))
+        for name, stats in results['views'].items():
+            with self.subTest(view=name):
+                self.assertEqual(stats['requests'], 3)
+                self.assertEqual(stats['errors'], 0)
+                self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+        self.assertGreater(results['views']['post_detail']['queries'], 0)
+
+
+METRICS_DIR = tempfile.mkdtemp()
+
+
+@override_settings(METRICS_DIR=METRICS_DIR)
+class MetricsTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(METRICS_DIR, ignore_errors=True)
+
+    def setUp(self):
+        metrics.registry().views.clear()
+        for filename in os.listdir(METRICS_DIR):
+            os.remove(os.path.join(METRICS_DIR, filename))
+        self.client = Client()
+
+    def test_cache_wrapper_counts_hits_once(self):
+        wrapped = InstrumentedCache('metrics-test', {
+            'INNER_BACKEND': 'django.core.cache.backends.locmem.LocMemCache'})
+        wrapped.set('a', 1)
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current.set(request_metrics)
+        try:
+            self.assertEqual(wrapped.get_many(['a', 'b']), {'a': 1})
+            self.assertIsNone(wrapped.get('b'))
+        finally:
+            metrics.current.reset(token)
+        self.assertEqual(request_metrics.cache_hits, 1)
+        self.assertEqual(request_metrics.cache_misses, 2)
+        self.assertIn('a', wrapped)
+
+    def test_hidden_from_external_addresses(self):
+        response = self.client.get('/metrics', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 404)
+
+    def test_reports_view_metrics_of_all_processes(self):
+        author = User.objects.create_user(username='author')
+        Post.objects.create(author=author, text='Пост')
+        self.client.get('/')
+        metrics.registry().flush()
+        other_process = metrics.empty_view()
+        other_process['duration']['count'] = 2
+        with open(os.path.join(METRICS_DIR, '1.json'), 'w') as other:
+            json.dump({'posts:index': other_process}, other)
+        views = metrics.collect()
+        self.assertEqual(views['posts:index']['duration']['count'], 3)
+        self.assertGreater(views['posts:index']['db_queries'], 0)
+        self.assertGreater(views['posts:index']['template_seconds'], 0)
+        self.assertGreater(
+            views['posts:index']['cache_hits']
+            + views['posts:index']['cache_misses'], 0)
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertContains(
+            response,
+            'yatube_request_duration_seconds_count{view="posts:index"} 3')
+        self.assertContains(
+            response, 'yatube_requests_total{view="posts:index",status="200"}')
+
+
+class TracingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.author = User.objects.create_user(username='author')
+
+    def traces(self):
+        return os.listdir(self.directory.name)
+
+    def test_unsampled_requests_are_not_traced(self):
+        with self.settings(TRACE_DIR=self.directory.name,
+                           TRACE_SAMPLE_RATE=0):
+            self.client.get('/')
+        self.assertEqual(self.traces(), [])
+
+    def test_writes_chrome_trace_with_nested_spans(self):
+        post = Post.objects.create(author=self.author, text='Пост')
+        with self.settings(TRACE_DIR=self.directory.name,
+                           TRACE_SAMPLE_RATE=1):
+            self.client.get(f'/posts/{post.pk}/')
+        filename, = self.traces()
+        self.assertIn('posts.post_detail', filename)
+        with open(os.path.join(self.directory.name, filename)) as trace:
+            events = json.load(trace)['traceEvents']
+        self.assertEqual({event['cat'] for event in events},
+                         {'view', 'db', 'cache', 'template'})
+        root = next(event for event in events if event['cat'] == 'view')
+        self.assertEqual(root['args']['status'], 200)
+        for event in events:
+            self.assertEqual(event['ph'], 'X')
+            self.assertGreaterEqual(event['ts'], root['ts'])
+            self.assertLessEqual(event['ts'] + event['dur'],
+                                 root['ts'] + root['dur'])
+
+    def test_thumbnail_generation_is_traced(self):
+        with tempfile.TemporaryDirectory() as media_root:
+            with self.settings(MEDIA_ROOT=media_root):
+                post = Post.objects.create(
+                    author=self.author, text='Пост', image=SimpleUploadedFile(
+                        'small.gif', small_gif, content_type='image/gif'))
+                trace = tracing.Trace()
+                token = tracing.current.set(trace)
+                try:
+                    thumbnails.make(post.image)
+                finally:
+                    tracing.current.reset(token)
+        spans = [event for event in trace.events
+                 if event['name'] == 'thumbnail']
+        self.assertEqual(len(spans), len(thumbnails.GEOMETRIES))
+        self.assertEqual(spans[0]['args']['image'], post.image.name)
+
+
+PROFILE_DIR = tempfile.mkdtemp()
+
+
+@override_settings(PROFILE_DIR=PROFILE_DIR)
+class ProfilingTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(PROFILE_DIR, ignore_errors=True)
+
+    def setUp(self):
+        for filename in os.listdir(PROFILE_DIR):
+            os.remove(os.path.join(PROFILE_DIR, filename))
+
+    def test_sampler_collapses_stacks(self):
+        def busy():
+            finish = time.perf_counter() + 0.1
+            while time.perf_counter() < finish:
+                pass
+
+        with profiling.StackSampler(interval=0.001) as sampler:
+            busy()
+        self.assertTrue(any(stack.endswith(';' + sampler.label(
+            busy.__code__)) for stack in sampler.stacks))
+        self.assertIn('test_sampler_collapses_stacks (core/test.py:',
+                      next(iter(sampler.stacks)))
+
+    def test_signed_header_profiles_request(self):
+        for mode in profiling.PROFILERS:
+            with self.subTest(mode=mode):
+                response = self.client.get(
+                    '/', HTTP_X_PROFILE=profiling.make_token(mode))
+                filename = response['X-Profile-File']
+                self.assertIn('posts.index', filename)
+                self.assertTrue(filename.endswith(
+                    profiling.PROFILERS[mode].extension))
+                self.assertTrue(os.path.exists(
+                    os.path.join(PROFILE_DIR, filename)))
+
+    def test_bad_signature_is_ignored(self):
+        token = profiling.make_token('sampler') + 'x'
+        response = self.client.get('/', HTTP_X_PROFILE=token)
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(os.listdir(PROFILE_DIR), [])
+
+    def test_token_command(self):
+        out = StringIO()
+        call_command('profile_token', '--mode=cprofile', stdout=out,
+                     stderr=StringIO())
+        request = SimpleNamespace(
+            META={profiling.HEADER: out.getvalue().strip()})
+        self.assertEqual(profiling.requested_mode(request), 'cprofile')
@@ -0,0 +1,77 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Трассировка запроса, который сейчас обрабатывается, если он попал в
+# выборку.
+current = ContextVar('trace', default=None)
+
+# Длина SQL в аргументах спана.
+SQL_LENGTH = 500
+
+_disabled = nullcontext()
+
+
+class Trace:
+    '''Спаны одного запроса в виде событий формата Chrome trace.'''
+
+    def __init__(self):
+        self.events = []
+
+    def add(self, name, category, started, finished, args):
+        self.events.append({
+            'name': name, 'cat': category, 'ph': 'X',
+            'ts': round(started * 1e6, 3),
+            'dur': round((finished - started) * 1e6, 3),
+            'pid': os.getpid(), 'tid': threading.get_ident(),
+            'args': args,
+        })
+
+    def save(self, label):
+        '''Сохранит трассировку в отдельный файл в settings.TRACE_DIR.'''
+        os.makedirs(settings.TRACE_DIR, exist_ok=True)
+        filename = '{}-{}-{}.json'.format(
+            time.strftime('%Y%m%d-%H%M%S'), label.replace(':', '.'),
+            uuid.uuid4().hex[:8])
+        path = os.path.join(settings.TRACE_DIR, filename)
+        with open(path, 'w') as output:
+            json.dump({'traceEvents': self.events,
+                       'displayTimeUnit': 'ms'}, output)
+        return path
+
+
+def sampled():
+    return random.random() < settings.TRACE_SAMPLE_RATE
+
+
+@contextmanager
+def _span(trace, name, category, args):
+    started = time.perf_counter()
+    try:
+        yield args
+    finally:
+        trace.add(name, category, started, time.perf_counter(), args)
+
+
+def span(name, category, **args):
+    '''
+    Замерит блок как спан текущей трассировки. Вне трассировки ничего не
+    делает, поэтому обертки стоят дешево для запросов вне выборки.
+    '''
+    trace = current.get()
+    if trace is None:
+        return _disabled
+    return _span(trace, name, category, args)
+
+
+def execute(execute, sql, params, many, context):
+    '''Обертка для execute_wrapper: спан на каждый запрос к базе.'''
+    with span('sql', 'db', sql=sql[:SQL_LENGTH], many=many):
+        return execute(sql, params, many, context)
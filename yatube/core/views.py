@@ -1,5 +1,9 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
 
+from . import metrics
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
@@ -15,3 +19,12 @@ def server_error(request):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf', status=403)
+
+
+def metrics_view(request):
+    '''Показатели всех процессов в формате Prometheus, только для
+    INTERNAL_IPS.'''
+    if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS:
+        raise Http404
+    return HttpResponse(metrics.render(metrics.collect()),
+                        content_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+
+_executor = None
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='background')
+    return _executor
+
+
+def use_pool():
+    '''
+    Потоки нужны, если они заданы и база выдержит параллельную запись:
+    общая база SQLite в памяти, как в тестах, ее не выдерживает.
+    '''
+    in_memory = getattr(connection, 'is_in_memory_db', lambda: False)
+    return bool(settings.THUMBNAIL_WORKERS) and not in_memory()
+
+
+def _run_in_worker(function, args):
+    try:
+        function(*args)
+    finally:
+        connections.close_all()
+
+
+def run_on_commit(function, *args):
+    '''
+    После фиксации транзакции отправит function(*args) в пул
+    settings.THUMBNAIL_WORKERS потоков, а при нуле потоков выполнит сразу.
+    '''
+    def submit():
+        if use_pool():
+            executor().submit(_run_in_worker, function, args)
+        else:
+            function(*args)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_PREFIX = 'feed_version:'
+
+
+def version(scope):
+    '''
+    Текущая версия кэша ленты scope. Начальное значение берется из
+    времени, чтобы после вытеснения ключа не ожили старые фрагменты.
+    '''
+    return cache.get_or_set(VERSION_PREFIX + scope, time.time_ns, None)
+
+
+def bump(*scopes):
+    '''Сделает недействительными все закэшированные страницы лент scopes.'''
+    for scope in scopes:
+        try:
+            cache.incr(VERSION_PREFIX + scope)
+        except ValueError:
+            cache.set(VERSION_PREFIX + scope, time.time_ns(), None)
+
+
+def feed_key(request, scope):
+    '''
+    Ключ фрагмента ленты: версия, страница или курсор и то, авторизован
+    ли пользователь.
+    '''
+    return ':'.join((
+        str(version(scope)),
+        request.GET.get('page', '1'),
+        request.GET.get('cursor', ''),
+        str(int(request.user.is_authenticated)),
+    ))
+
+
+def feed_context(request, scope):
+    return {
+        'feed_cache_key': feed_key(request, scope),
+        'feed_cache_timeout': settings.FEED_CACHE_TIMEOUT,
+    }
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import counters, thumbnails
+
+TEMPLATE = 'includes/posts.html'
+
+
+def card_key(post_id):
+    return f'post:{post_id}:v{settings.POST_CARD_VERSION}'
+
+
+def render_cards(posts):
+    '''
+    Вернет список пар (пост, html карточки). Карточки страницы берутся
+    из кэша одним get_many, отрисовываются только промахи; миниатюры
+    и их адаптивные варианты для них разрешаются одним запросом.
+    '''
+    posts = list(posts)
+    cached = cache.get_many([card_key(post.pk) for post in posts])
+    missing = [post for post in posts if card_key(post.pk) not in cached]
+    comment_counts = counters.get_counts(
+        counters.comments_scope(post.pk) for post in missing)
+    thumbs = thumbnails.resolve(
+        (post.image for post in missing), thumbnails.GEOMETRIES)
+    rendered = {}
+    for post in missing:
+        thumb, *variants = thumbs.get(post.image.name) or [None]
+        rendered[card_key(post.pk)] = render_to_string(TEMPLATE, {
+            'post': post,
+            'comment_count': comment_counts[counters.comments_scope(post.pk)],
+            'thumb': thumb,
+            'size': thumbnails.card_size(post),
+            'sources': thumbnails.sources(variants),
+        })
+    cards = []
+    for post in posts:
+        key = card_key(post.pk)
+        cards.append((post, mark_safe(cached.get(key, rendered.get(key)))))
+    cache.set_many(rendered, settings.POST_CARD_TIMEOUT)
+    # Карточки с заглушкой сбросит задача, создавшая миниатюры, поэтому
+    # ставить ее можно только после их сохранения.
+    for post in missing:
+        if post.image and thumbs[post.image.name][0] is None:
+            thumbnails.enqueue(post.image)
+    return cards
+
+
+def invalidate(post_ids):
+    cache.delete_many([card_key(post_id) for post_id in post_ids])
@@ -0,0 +1,156 @@
+from django.core.cache import cache
+from django.db.models import Count, F
+
+from .models import (Comment, Counter, FeedEntry, Follow, Mention, Post,
+                     PostTag)
+
+CACHE_TIMEOUT = 60 * 60
+CACHE_PREFIX = 'counter:'
+
+ALL = 'all'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def feed_scope(user_id):
+    '''Записи, разложенные в материализованную ленту пользователя.'''
+    return f'feed:{user_id}'
+
+
+def followers_scope(author_id):
+    return f'followers:{author_id}'
+
+
+def following_scope(user_id):
+    return f'following:{user_id}'
+
+
+def comments_scope(post_id):
+    return f'comments:{post_id}'
+
+
+def tag_scope(tag):
+    return f'tag:{tag}'
+
+
+def mentions_scope(user_id):
+    return f'mentions:{user_id}'
+
+
+def _count_by(queryset, field, ids):
+    '''Посчитает записи queryset одним запросом с группировкой по field.'''
+    rows = (queryset.filter(**{f'{field}__in': ids})
+            .order_by().values_list(field).annotate(total=Count('id')))
+    return dict(rows)
+
+
+COMPUTE = {
+    'group': lambda ids: _count_by(Post.objects, 'group_id', ids),
+    'author': lambda ids: _count_by(Post.objects, 'author_id', ids),
+    'feed': lambda ids: _count_by(FeedEntry.objects, 'user_id', ids),
+    'followers': lambda ids: _count_by(Follow.objects, 'author_id', ids),
+    'following': lambda ids: _count_by(Follow.objects, 'user_id', ids),
+    'comments': lambda ids: _count_by(Comment.objects, 'post_id', ids),
+    'tag': lambda tags: _count_by(PostTag.objects, 'tag', tags),
+    'mentions': lambda ids: _count_by(Mention.objects, 'user_id', ids),
+}
+
+
+def _compute(scopes):
+    '''
+    Посчитает значения счетчиков по исходным таблицам, по одному запросу
+    на каждый вид области видимости.
+    '''
+    values = {}
+    by_kind = {}
+    for scope in scopes:
+        if scope == ALL:
+            values[scope] = Post.objects.count()
+            continue
+        kind, key = scope.split(':', 1)
+        by_kind.setdefault(kind, []).append(key)
+    for kind, keys in by_kind.items():
+        totals = {str(key): total
+                  for key, total in COMPUTE[kind](keys).items()}
+        for key in keys:
+            values[f'{kind}:{key}'] = totals.get(key, 0)
+    return values
+
+
+def get_counts(scopes):
+    '''
+    Вернет словарь scope -> количество записей. Значения берутся из кэша,
+    затем из таблицы счетчиков; отсутствующие счетчики считаются один
+    раз и сохраняются.
+    '''
+    scopes = list(scopes)
+    cached = cache.get_many([CACHE_PREFIX + scope for scope in scopes])
+    values = {scope: cached[CACHE_PREFIX + scope] for scope in scopes
+              if CACHE_PREFIX + scope in cached}
+    missing = [scope for scope in scopes if scope not in values]
+    if not missing:
+        return values
+    stored = dict(Counter.objects.filter(scope__in=missing)
+                  .values_list('scope', 'value'))
+    computed = _compute([scope for scope in missing if scope not in stored])
+    Counter.objects.bulk_create(
+        [Counter(scope=scope, value=value)
+         for scope, value in computed.items()],
+        ignore_conflicts=True,
+    )
+    stored.update(computed)
+    cache.set_many({CACHE_PREFIX + scope: value
+                    for scope, value in stored.items()}, CACHE_TIMEOUT)
+    values.update(stored)
+    return values
+
+
+def get_count(scope):
+    return get_counts([scope])[scope]
+
+
+def change(scopes, delta):
+    '''
+    Атомарно изменит существующие счетчики на delta и сбросит их кэш.
+    Несозданные счетчики будут посчитаны при первом чтении.
+    '''
+    scopes = list(scopes)
+    if not scopes or not delta:
+        return
+    Counter.objects.filter(scope__in=scopes).update(value=F('value') + delta)
+    cache.delete_many([CACHE_PREFIX + scope for scope in scopes])
+
+
+def remove(scopes):
+    '''Удалит счетчики scopes удаленных записей вместе с их кэшем.'''
+    scopes = list(scopes)
+    Counter.objects.filter(scope__in=scopes).delete()
+    cache.delete_many([CACHE_PREFIX + scope for scope in scopes])
+
+
+def repair(scopes):
+    '''
+    Пересчитает счетчики scopes по исходным таблицам, исправит
+    расхождения и создаст недостающие. Вернет число исправленных.
+    '''
+    scopes = list(scopes)
+    actual = _compute(scopes)
+    stale = []
+    for counter in Counter.objects.filter(scope__in=scopes):
+        value = actual.pop(counter.scope)
+        if counter.value != value:
+            counter.value = value
+            stale.append(counter)
+    Counter.objects.bulk_update(stale, ['value'])
+    Counter.objects.bulk_create(
+        [Counter(scope=scope, value=value) for scope, value in actual.items()],
+        ignore_conflicts=True,
+    )
+    cache.delete_many([CACHE_PREFIX + scope for scope in scopes])
+    return len(stale) + len(actual)
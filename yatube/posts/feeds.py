@@ -0,0 +1,203 @@
+import heapq
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from . import background, counters
+from .models import FeedEntry, Follow, Post, PulledAuthor
+
+BATCH_SIZE = 1000
+
+
+def is_pulled(author_id):
+    '''
+    Посты автора из PulledAuthor не раскладываются по лентам, а читаются
+    из таблицы постов при показе ленты.
+    '''
+    return PulledAuthor.objects.filter(author_id=author_id).exists()
+
+
+def update_fan_out(author_id):
+    '''
+    Вызывается при подписке и отписке. Автор, у которого подписчиков
+    стало больше settings.FEED_FANOUT_FOLLOWERS_LIMIT, читается
+    напрямую. Когда их остается не больше
+    settings.FEED_FANOUT_RESUME_LIMIT, раскладка возобновляется в фоне.
+    '''
+    followers = counters.get_count(counters.followers_scope(author_id))
+    if followers > settings.FEED_FANOUT_FOLLOWERS_LIMIT:
+        PulledAuthor.objects.bulk_create(
+            [PulledAuthor(author_id=author_id)], ignore_conflicts=True)
+    elif (followers <= settings.FEED_FANOUT_RESUME_LIMIT
+          and is_pulled(author_id)):
+        background.run_on_commit(resume_fan_out, author_id)
+
+
+def fan_out(post):
+    '''Разложит новый пост в ленты всех подписчиков автора.'''
+    if is_pulled(post.author_id):
+        return
+    follower_ids = list(Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True))
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in follower_ids),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    counters.change(map(counters.feed_scope, follower_ids), 1)
+
+
+def retract(post):
+    '''Уменьшит счетчики лент, из которых будет удален пост.'''
+    user_ids = FeedEntry.objects.filter(post=post).values_list(
+        'user_id', flat=True)
+    counters.change(map(counters.feed_scope, user_ids), -1)
+
+
+def backfill(user_id, author_id):
+    '''
+    Добавит в ленту пользователя посты автора, на которого он
+    подписался. Посты автора, читаемого напрямую, добавляются только
+    опубликованные до того, как он стал так читаться.
+    '''
+    posts = Post.objects.filter(author_id=author_id)
+    pulled = PulledAuthor.objects.filter(author_id=author_id).first()
+    if pulled is not None:
+        posts = posts.filter(pub_date__lt=pulled.since)
+    posts = list(posts.values_list('id', 'pub_date'))
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    counters.change([counters.feed_scope(user_id)], len(posts))
+
+
+def _fan_out_posts(posts, follower_ids):
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts for user_id in follower_ids),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    counters.change(map(counters.feed_scope, follower_ids), len(posts))
+
+
+def resume_fan_out(author_id):
+    '''
+    Фоновая задача: разложит по лентам подписчиков посты, опубликованные,
+    пока автор читался напрямую, пачками по BATCH_SIZE записей и снимет
+    с автора отметку. Последняя пачка и снятие отметки идут в одной
+    транзакции, чтобы новые посты не проскочили между ними.
+    '''
+    pulled = PulledAuthor.objects.filter(author_id=author_id).first()
+    followers = counters.get_count(counters.followers_scope(author_id))
+    if pulled is None or followers > settings.FEED_FANOUT_RESUME_LIMIT:
+        return
+    follower_ids = list(Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True))
+    posts = Post.objects.filter(
+        author_id=author_id, pub_date__gte=pulled.since).order_by('pk')
+    batch_size = max(BATCH_SIZE // max(len(follower_ids), 1), 1)
+    last_id = 0
+    while True:
+        batch = list(posts.filter(pk__gt=last_id).values_list(
+            'id', 'pub_date')[:batch_size])
+        if len(batch) < batch_size:
+            break
+        _fan_out_posts(batch, follower_ids)
+        last_id = batch[-1][0]
+    with transaction.atomic():
+        _fan_out_posts(
+            list(posts.filter(pk__gt=last_id).values_list('id', 'pub_date')),
+            follower_ids)
+        pulled.delete()
+
+
+def trim(user_id, author_id):
+    '''Уберет из ленты пользователя посты автора, от которого он
+    отписался.'''
+    deleted, _ = FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+    counters.change([counters.feed_scope(user_id)], -deleted)
+
+
+class HybridTimeline:
+    '''
+    Лента подписок из двух упорядоченных потоков: постов, разложенных в
+    FeedEntry, и постов популярных авторов, читаемых напрямую. Срез
+    берет начало обоих потоков и сливает их кучей по (pub_date, id).
+    Поддерживает filter() и order_by() настолько, насколько это нужно
+    паджинаторам из posts.utils.
+    '''
+    ordered = True
+
+    def __init__(self, pushed, pulled, pulled_ids=(), user_id=None,
+                 reverse=True):
+        self.pushed = pushed
+        self.pulled = pulled
+        self.pulled_ids = pulled_ids
+        self.user_id = user_id
+        self.reverse = reverse
+
+    def _clone(self, pushed, pulled, reverse=None):
+        return HybridTimeline(
+            pushed, pulled, self.pulled_ids, self.user_id,
+            self.reverse if reverse is None else reverse)
+
+    def filter(self, *args, **kwargs):
+        return self._clone(self.pushed.filter(*args, **kwargs),
+                           self.pulled.filter(*args, **kwargs))
+
+    def order_by(self, *fields):
+        return self._clone(self.pushed.order_by(*fields),
+                           self.pulled.order_by(*fields),
+                           reverse=fields[0].startswith('-'))
+
+    def count(self):
+        scopes = [counters.feed_scope(self.user_id)]
+        scopes.extend(map(counters.author_scope, self.pulled_ids))
+        total = sum(counters.get_counts(scopes).values())
+        if self.pulled_ids:
+            # Записи, разложенные до того, как автор стал читаться
+            # напрямую, есть в обоих потоках.
+            total -= FeedEntry.objects.filter(
+                user_id=self.user_id,
+                post__author_id__in=self.pulled_ids).count()
+        return total
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        merged = heapq.merge(
+            self.pushed[:index.stop], self.pulled[:index.stop],
+            key=lambda post: (post.pub_date, post.pk), reverse=self.reverse)
+        posts = []
+        seen = set()
+        for post in merged:
+            if post.pk not in seen:
+                seen.add(post.pk)
+                posts.append(post)
+        return posts[index]
+
+
+def pulled_authors(user):
+    '''Авторы из подписок пользователя, чьи посты читаются напрямую.'''
+    return list(PulledAuthor.objects.filter(
+        author__following__user=user).values_list('author_id', flat=True))
+
+
+def timeline(user):
+    '''Посты ленты подписок пользователя, от новых к старым.'''
+    pushed = Post.objects.filter(feed_entries__user=user).select_related(
+        'author', 'group').order_by(F('feed_entries__pub_date').desc(),
+                                    F('feed_entries__post_id').desc())
+    pulled_ids = pulled_authors(user)
+    pulled = Post.objects.none()
+    if pulled_ids:
+        pulled = Post.objects.filter(author_id__in=pulled_ids).select_related(
+            'author', 'group').order_by('-pub_date', '-id')
+    return HybridTimeline(pushed, pulled, pulled_ids, user.pk)
@@ -1,5 +1,10 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
+from PIL import Image
 
+from . import images
 from .models import Post, Comment
 
 
@@ -12,6 +17,17 @@ class PostForm(ModelForm):
             'group': ('Does this post refer to any group from the list?')
         }
 
+    def clean_image(self):
+        '''Слишком большие картинки уменьшаются до сохранения.'''
+        image = self.cleaned_data.get('image')
+        if not isinstance(image, UploadedFile):
+            return image
+        try:
+            return images.downscale(image, settings.IMAGE_MAX_SIDE)
+        except (OSError, ValueError, KeyError,
+                Image.DecompressionBombError):
+            raise ValidationError('Не удалось обработать картинку.')
+
 
 class CommentForm(ModelForm):
     class Meta:
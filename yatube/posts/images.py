@@ -0,0 +1,100 @@
+import hashlib
+import logging
+import os
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models.fields.files import FieldFile
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+METADATA_FIELDS = ('image_width', 'image_height', 'image_format',
+                   'image_size', 'image_hash')
+EMPTY_METADATA = {'image_width': None, 'image_height': None,
+                  'image_format': '', 'image_size': None, 'image_hash': ''}
+# Картинки в форматах, которые Pillow только читает, например PSD,
+# уменьшаются в PNG; режимы не из этого списка переводятся в RGBA.
+FALLBACK_FORMAT = 'PNG'
+FALLBACK_MODES = {'1', 'L', 'LA', 'I', 'P', 'RGB', 'RGBA'}
+
+
+def read_metadata(file):
+    '''
+    Прочитает размеры и формат из заголовка изображения, посчитает его
+    размер в байтах и SHA-256 за один проход по файлу. Хэш запоминается
+    в атрибуте sha256 файла, чтобы хранилище не считало его заново.
+    '''
+    digest = hashlib.sha256()
+    size = 0
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    file.seek(0)
+    with Image.open(file) as image:
+        width, height = image.size
+        image_format = image.format
+    file.seek(0)
+    # Хранилище поля получает загруженный файл, а не FieldFile.
+    target = file.file if isinstance(file, FieldFile) else file
+    target.sha256 = digest.hexdigest()
+    return {'image_width': width, 'image_height': height,
+            'image_format': image_format, 'image_size': size,
+            'image_hash': digest.hexdigest()}
+
+
+def downscale(upload, max_side):
+    '''
+    Уменьшит загруженную картинку, чтобы большая сторона была не больше
+    max_side. JPEG декодируется в режиме draft сразу в уменьшенном
+    масштабе. Вернет новый временный файл, который уходит на диск сверх
+    FILE_UPLOAD_MAX_MEMORY_SIZE, или upload, если уменьшать не нужно.
+    Формат сохраняется, если Pillow умеет в него писать, иначе картинка
+    сохраняется в FALLBACK_FORMAT.
+    Pillow отказывается открывать картинку только при вдвое большем числе
+    пикселей, чем IMAGE_MAX_PIXELS, поэтому предел проверяется по
+    заголовку до декодирования.
+    '''
+    upload.seek(0)
+    with Image.open(upload) as image:
+        width, height = image.size
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            raise Image.DecompressionBombError(
+                f'Картинка {width}x{height} больше '
+                f'{settings.IMAGE_MAX_PIXELS} пикселей.')
+        if max(image.size) <= max_side:
+            upload.seek(0)
+            return upload
+        image_format = image.format
+        name = upload.name
+        image.draft('RGB', (max_side, max_side))
+        image.thumbnail((max_side, max_side))
+        if image_format not in Image.SAVE:
+            image_format = FALLBACK_FORMAT
+            name = f'{os.path.splitext(name)[0]}.{image_format.lower()}'
+            if image.mode not in FALLBACK_MODES:
+                image = image.convert('RGBA')
+        result = File(SpooledTemporaryFile(
+            settings.FILE_UPLOAD_MAX_MEMORY_SIZE), name=name)
+        image.save(result, format=image_format)
+    result.seek(0)
+    return result
+
+
+def fill_metadata(post):
+    '''
+    Заполнит поля метаданных картинки поста. Вернет False, если картинки
+    нет или файл не читается; поля тогда останутся пустыми.
+    '''
+    metadata = EMPTY_METADATA
+    if post.image:
+        try:
+            metadata = read_metadata(post.image)
+        except (OSError, ValueError):
+            logger.warning('Не удалось прочитать картинку %s',
+                           post.image.name)
+    for field, value in metadata.items():
+        setattr(post, field, value)
+    return metadata is not EMPTY_METADATA
@@ -0,0 +1,94 @@
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from sorl.thumbnail import default, delete as delete_thumbnails
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from posts.models import Post
+from posts.utils import batches
+
+
+def walk(storage, directory):
+    '''Имена всех файлов каталога directory хранилища storage.'''
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield os.path.join(directory, name)
+    for name in directories:
+        yield from walk(storage, os.path.join(directory, name))
+
+
+class Command(BaseCommand):
+    help = ('Удалит картинки, на которые не ссылается ни один пост, и '
+            'миниатюры, которых нет в хранилище ключей sorl.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, сколько места освободится.')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько файлов сверять с базой за раз.')
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help='Не трогать файлы моложе стольких секунд: их пост может '
+                 'быть еще не сохранен.')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.before = timezone.now() - timedelta(seconds=options['min_age'])
+        self.deleted = self.reclaimed = 0
+        storage = Post._meta.get_field('image').storage
+        upload_to = Post._meta.get_field('image').upload_to
+        for batch in batches(walk(storage, upload_to), options['batch_size']):
+            referenced = set(Post.objects.filter(image__in=batch)
+                             .values_list('image', flat=True))
+            for name in batch:
+                if name not in referenced:
+                    self.collect_original(storage, name)
+        prefix = sorl_settings.THUMBNAIL_PREFIX.rstrip('/')
+        for batch in batches(walk(default.storage, prefix),
+                             options['batch_size']):
+            keys = {add_prefix(ImageFile(name, default.storage).key): name
+                    for name in batch}
+            known = set(KVStoreModel.objects.filter(key__in=keys)
+                        .values_list('key', flat=True))
+            for key, name in keys.items():
+                if key not in known:
+                    self.collect(default.storage, name, default.storage.delete)
+        verb = 'Будет удалено' if self.dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} файлов: {self.deleted}, '
+            f'освобождено байт: {self.reclaimed}'))
+
+    def collect(self, storage, name, delete):
+        if storage.get_modified_time(name) > self.before:
+            return False
+        self.reclaimed += storage.size(name)
+        self.deleted += 1
+        if not self.dry_run:
+            delete(name)
+        return True
+
+    def collect_original(self, storage, name):
+        '''
+        Удалит оригинал вместе с его миниатюрами и записями sorl, учтя
+        в отчете и размер миниатюр.
+        '''
+        image = Post(image=name).image
+        source = ImageFile(image)
+        thumbnail_keys = default.kvstore._get(
+            source.key, identity='thumbnails') or []
+        sizes = [default.storage.size(thumbnail.name) for thumbnail
+                 in map(default.kvstore._get, thumbnail_keys)
+                 if thumbnail and thumbnail.exists()]
+        if self.collect(storage, name,
+                        lambda name: delete_thumbnails(image)):
+            self.reclaimed += sum(sizes)
+            self.deleted += len(sizes)
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from posts import images
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Заполнит размеры, формат и хэш картинок у существующих постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Сколько постов читать и сохранять за раз.')
+
+    def handle(self, *args, **options):
+        posts = (Post.objects.exclude(image='').filter(image_hash='')
+                 .only('pk', 'image').order_by('pk'))
+        last_pk = 0
+        filled = failed = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            done = []
+            for post in batch:
+                if images.fill_metadata(post):
+                    done.append(post)
+                    post.image.close()
+                else:
+                    failed += 1
+            Post.objects.bulk_update(done, images.METADATA_FIELDS)
+            filled += len(done)
+        self.stdout.write(self.style.SUCCESS(
+            f'Заполнено картинок: {filled}, не прочитано: {failed}'))
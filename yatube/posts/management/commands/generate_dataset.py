@@ -0,0 +1,286 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from faker import Faker
+from PIL import Image
+
+from posts import caching, images, tags
+from posts.models import (Comment, FeedEntry, Follow, Group, Mention, Post,
+                          PostTag, User)
+from posts.utils import batches
+
+# Пароль всех сгенерированных пользователей; хэшируется один раз.
+PASSWORD = 'password'
+# Показатель степенного распределения популярности авторов и постов.
+ALPHA = 1.5
+
+
+@contextmanager
+def explicit_pub_date(*models):
+    '''Отключит auto_now_add у pub_date, чтобы сохранить заданные даты.'''
+    fields = [model._meta.get_field('pub_date') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def power_weights(rng, count):
+    '''Накопленные веса Парето для выбора с предпочтением популярных.'''
+    return list(accumulate(rng.paretovariate(ALPHA) for _ in range(count)))
+
+
+def insert(model, objects, batch_size):
+    '''
+    Сохранит objects порциями через bulk_create и проставит им pk: SQLite
+    не возвращает ключи, поэтому они читаются после каждой вставки.
+    '''
+    for batch in batches(objects, batch_size):
+        last_pk = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        model.objects.bulk_create(batch)
+        pks = model.objects.filter(pk__gt=last_pk).order_by('pk')
+        for obj, pk in zip(batch, pks.values_list('pk', flat=True)):
+            obj.pk = pk
+        yield from batch
+
+
+class Command(BaseCommand):
+    help = ('Создаст синтетический набор данных: пользователей, граф '
+            'подписок со степенным распределением, посты и комментарии.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее число подписок на пользователя.')
+        parser.add_argument(
+            '--images', type=int, default=0,
+            help='Сколько разных картинок создать для постов.')
+        parser.add_argument(
+            '--image-ratio', type=float, default=0.2,
+            help='Доля постов с картинкой.')
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько последних дней распределить посты.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix', default='user',
+            help='Префикс имен сгенерированных пользователей.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=options['prefix']):
+            raise CommandError(
+                f'Пользователи с префиксом {options["prefix"]} уже есть, '
+                'задайте другой --prefix.')
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(options['seed'])
+        self.now = timezone.now()
+        started = time.monotonic()
+        with transaction.atomic():
+            self.create_users()
+            self.create_groups()
+            self.create_follows()
+            self.create_images()
+            first_post_pk = Post.objects.aggregate(last=Max('pk'))['last']
+            with explicit_pub_date(Post, Comment):
+                self.create_posts()
+                self.create_comments()
+            self.fill_feeds(first_post_pk or 0)
+        call_command('repair_counters', '--create', stdout=self.stdout)
+        caching.bump('index')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с'))
+
+    @contextmanager
+    def phase(self, title):
+        '''Замерит этап и выведет его пропускную способность.'''
+        counted = []
+        started = time.monotonic()
+        yield counted.append
+        elapsed = time.monotonic() - started
+        total = sum(counted)
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(f'{title}: {total} за {elapsed:.1f} с '
+                          f'({rate:.0f} в секунду)')
+
+    def create_users(self):
+        password = make_password(PASSWORD)
+        prefix = self.options['prefix']
+        users = (
+            User(username=f'{prefix}{number}', password=password,
+                 first_name=self.fake.first_name(),
+                 last_name=self.fake.last_name())
+            for number in range(self.options['users'])
+        )
+        with self.phase('Пользователи') as done:
+            self.users = [(user.pk, user.username)
+                          for user in insert(User, users, self.batch_size)]
+            done(len(self.users))
+        self.user_weights = power_weights(self.rng, len(self.users))
+
+    def create_groups(self):
+        seed = self.options['seed']
+        groups = (
+            Group(title=self.fake.catch_phrase()[:200],
+                  slug=f'{self.options["prefix"]}-{seed}-{number}',
+                  description=self.fake.paragraph())
+            for number in range(self.options['groups'])
+        )
+        with self.phase('Группы') as done:
+            self.group_ids = [group.pk for group
+                              in insert(Group, groups, self.batch_size)]
+            done(len(self.group_ids))
+
+    def pick_users(self, count):
+        return self.rng.choices(self.users, cum_weights=self.user_weights,
+                                k=count)
+
+    def create_follows(self):
+        '''Подписки: число — по Парето, авторы — по популярности.'''
+        scale = self.options['follows'] / (ALPHA / (ALPHA - 1))
+        with self.phase('Подписки') as done:
+            for batch in batches(self.users, self.batch_size):
+                follows = []
+                for user_id, _ in batch:
+                    count = round(self.rng.paretovariate(ALPHA) * scale)
+                    authors = {author_id for author_id, _
+                               in self.pick_users(count)}
+                    authors.discard(user_id)
+                    follows.extend(Follow(user_id=user_id, author_id=author)
+                                   for author in authors)
+                Follow.objects.bulk_create(follows)
+                done(len(follows))
+
+    def create_images(self):
+        storage = Post._meta.get_field('image').storage
+        self.images = []
+        with self.phase('Картинки') as done:
+            for _ in range(self.options['images']):
+                size = (self.rng.randint(400, 1600),
+                        self.rng.randint(300, 900))
+                color = tuple(self.rng.randrange(256) for _ in range(3))
+                buffer = BytesIO()
+                Image.new('RGB', size, color).save(buffer, 'JPEG')
+                content = ContentFile(buffer.getvalue(), name='image.jpg')
+                metadata = images.read_metadata(content)
+                name = storage.save('posts/image.jpg', content)
+                self.images.append((name, metadata))
+            done(len(self.images))
+
+    def make_post(self):
+        (author_id, _), = self.pick_users(1)
+        text = self.fake.paragraph(nb_sentences=self.rng.randint(1, 5))
+        if self.rng.random() < 0.3:
+            text += ' ' + ' '.join(
+                f'#{self.fake.word()}'
+                for _ in range(self.rng.randint(1, 3)))
+        if self.rng.random() < 0.1:
+            (_, username), = self.pick_users(1)
+            text += f' @{username}'
+        post = Post(
+            author_id=author_id, text=text,
+            group_id=(self.rng.choice(self.group_ids)
+                      if self.group_ids and self.rng.random() < 0.5 else None),
+            pub_date=self.now - timedelta(
+                seconds=self.rng.uniform(0, self.options['days'] * 86400)),
+        )
+        if self.images and self.rng.random() < self.options['image_ratio']:
+            name, metadata = self.rng.choice(self.images)
+            post.image = name
+            for field, value in metadata.items():
+                setattr(post, field, value)
+        return post
+
+    def index_posts(self, posts):
+        '''Заполнит индекс хэштегов и упоминаний для вставленных постов.'''
+        user_ids = {username: user_id for user_id, username in self.users}
+        post_tags = []
+        mentions = []
+        for post in posts:
+            post_tags.extend(
+                PostTag(tag=tag, post_id=post.pk, pub_date=post.pub_date)
+                for tag in tags.extract_tags(post.text))
+            mentions.extend(
+                Mention(user_id=user_ids[username], post_id=post.pk,
+                        pub_date=post.pub_date)
+                for username in tags.extract_mentions(post.text)
+                if username in user_ids)
+        PostTag.objects.bulk_create(post_tags, ignore_conflicts=True)
+        Mention.objects.bulk_create(mentions, ignore_conflicts=True)
+
+    def create_posts(self):
+        posts = (self.make_post() for _ in range(self.options['posts']))
+        self.posts = []
+        with self.phase('Посты') as done:
+            for batch in batches(insert(Post, posts, self.batch_size),
+                                 self.batch_size):
+                self.index_posts(batch)
+                self.posts.extend((post.pk, post.pub_date) for post in batch)
+                done(len(batch))
+
+    def create_comments(self):
+        '''Комментарии распределены по постам по Парето.'''
+        post_weights = power_weights(self.rng, len(self.posts))
+        with self.phase('Комментарии') as done:
+            for batch in batches(range(self.options['comments']),
+                                 self.batch_size):
+                chosen = self.rng.choices(self.posts, cum_weights=post_weights,
+                                          k=len(batch))
+                authors = self.pick_users(len(batch))
+                Comment.objects.bulk_create(
+                    Comment(post_id=post_id, author_id=author_id,
+                            text=self.fake.sentence(),
+                            pub_date=pub_date + (self.now - pub_date)
+                            * self.rng.random())
+                    for (post_id, pub_date), (author_id, _)
+                    in zip(chosen, authors))
+                done(len(batch))
+
+    def fill_feeds(self, first_post_pk):
+        '''
+        Разложит новые посты в ленты подписчиков одним INSERT ... SELECT,
+        пропустив популярных авторов, как это делает posts.feeds.
+        '''
+        pulled = list(
+            Follow.objects.values('author_id').annotate(
+                followers=Count('id'))
+            .filter(followers__gt=settings.FEED_FANOUT_FOLLOWERS_LIMIT)
+            .values_list('author_id', flat=True))
+        exclude = ''
+        if pulled:
+            exclude = ' AND post.author_id NOT IN ({})'.format(
+                ', '.join(map(str, pulled)))
+        sql = (
+            f'INSERT INTO {FeedEntry._meta.db_table} '
+            '(user_id, post_id, pub_date) '
+            'SELECT follow.user_id, post.id, post.pub_date '
+            f'FROM {Follow._meta.db_table} follow '
+            f'JOIN {Post._meta.db_table} post '
+            'ON post.author_id = follow.author_id '
+            f'WHERE post.id > %s{exclude}'
+        )
+        with self.phase('Записи лент') as done, connection.cursor() as cursor:
+            cursor.execute(sql, [first_post_pk])
+            done(cursor.rowcount)
@@ -0,0 +1,122 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import caching, cards, thumbnails
+from posts.models import Post
+
+
+def make_thumbnails(job):
+    '''Задача пула процессов: (pk, имя файла, геометрии) -> (pk, успех).'''
+    pk, name, geometries = job
+    return pk, thumbnails.make(Post(pk=pk, image=name).image, geometries)
+
+
+def image_batches(last_pk, batch_size):
+    '''Посты с изображениями после last_pk, порциями по pk.'''
+    while True:
+        rows = list(Post.objects.filter(pk__gt=last_pk).exclude(image='')
+                    .order_by('pk').values_list('pk', 'image')[:batch_size])
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        yield rows
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as checkpoint:
+            return json.load(checkpoint)['last_pk']
+    except (OSError, ValueError, KeyError):
+        return 0
+
+
+def write_checkpoint(path, last_pk):
+    with open(path + '.tmp', 'w') as checkpoint:
+        json.dump({'last_pk': last_pk}, checkpoint)
+    os.replace(path + '.tmp', path)
+
+
+class Command(BaseCommand):
+    help = ('Создаст миниатюры изображений всех постов в пуле процессов '
+            'с возможностью продолжить после прерывания.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--geometry', action='append',
+            choices=sorted({geometry
+                            for geometry, _ in thumbnails.GEOMETRIES}),
+            help='Создать только эти размеры из posts.thumbnails.GEOMETRIES.')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов; при нуле работа идет в этом процессе.')
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько изображений обрабатывать между контрольными '
+                 'точками.')
+        parser.add_argument(
+            '--checkpoint', default='.generate_thumbnails.json',
+            help='Файл контрольной точки.')
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Начать заново, не читая контрольную точку.')
+        parser.add_argument(
+            '--max-rate', type=float, default=0,
+            help='Не больше стольких изображений в секунду.')
+
+    def handle(self, *args, **options):
+        geometries = [
+            (geometry, geometry_options)
+            for geometry, geometry_options in thumbnails.GEOMETRIES
+            if not options['geometry'] or geometry in options['geometry']
+        ]
+        checkpoint = options['checkpoint']
+        last_pk = 0 if options['reset'] else read_checkpoint(checkpoint)
+        pool = None
+        if options['workers']:
+            # Дочерние процессы не должны унаследовать открытые соединения.
+            connections.close_all()
+            pool = ProcessPoolExecutor(options['workers'],
+                                       initializer=django.setup)
+        run = pool.map if pool else map
+        processed = failed = 0
+        started = time.monotonic()
+        try:
+            for batch in image_batches(last_pk, options['batch_size']):
+                jobs = [(pk, name, geometries) for pk, name in batch]
+                done_pks = []
+                for pk, done in run(make_thumbnails, jobs):
+                    if done:
+                        done_pks.append(pk)
+                    else:
+                        failed += 1
+                cards.invalidate(done_pks)
+                processed += len(batch)
+                last_pk = batch[-1][0]
+                write_checkpoint(checkpoint, last_pk)
+                self.throttle(processed, started, options['max_rate'])
+                self.stdout.write(
+                    f'Обработано {processed}, последний pk {last_pk}')
+        finally:
+            if pool:
+                pool.shutdown()
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        caching.bump('index')
+        elapsed = time.monotonic() - started
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {processed}, ошибок: {failed}, '
+            f'за {elapsed:.1f} с ({rate:.1f} изобр./с)'))
+
+    def throttle(self, processed, started, max_rate):
+        '''Подождет, если изображения обрабатываются быстрее max_rate.'''
+        if max_rate:
+            ahead = processed / max_rate - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
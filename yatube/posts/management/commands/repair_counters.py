@@ -0,0 +1,64 @@
+from itertools import chain
+
+from django.core.management.base import BaseCommand
+
+from posts import counters
+from posts.models import Counter, Group, Post, PostTag, User
+from posts.utils import batches
+
+
+def stored_scopes(batch_size):
+    '''Области видимости существующих счетчиков, порциями по pk.'''
+    last_pk = 0
+    while True:
+        rows = list(Counter.objects.filter(pk__gt=last_pk).order_by('pk')
+                    .values_list('pk', 'scope')[:batch_size])
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        yield from (scope for _, scope in rows)
+
+
+def all_scopes():
+    '''Области видимости для всех групп, пользователей, постов и тегов.'''
+    user_ids = User.objects.values_list('pk', flat=True).iterator()
+    user_scopes = (
+        scope(user_id) for user_id in user_ids
+        for scope in (counters.author_scope, counters.feed_scope,
+                      counters.followers_scope, counters.following_scope,
+                      counters.mentions_scope)
+    )
+    return chain(
+        [counters.ALL],
+        map(counters.group_scope,
+            Group.objects.values_list('pk', flat=True).iterator()),
+        user_scopes,
+        map(counters.comments_scope,
+            Post.objects.values_list('pk', flat=True).iterator()),
+        map(counters.tag_scope, PostTag.objects.order_by('tag').values_list(
+            'tag', flat=True).distinct().iterator()),
+    )
+
+
+class Command(BaseCommand):
+    help = 'Пересчитает счетчики записей и исправит расхождения.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--create', action='store_true',
+            help='Создать счетчики для всех групп, пользователей и постов.')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько счетчиков пересчитывать за раз.')
+
+    def handle(self, *args, **options):
+        if options['create']:
+            scopes = all_scopes()
+        else:
+            scopes = stored_scopes(options['batch_size'])
+        checked = repaired = 0
+        for batch in batches(scopes, options['batch_size']):
+            repaired += counters.repair(batch)
+            checked += len(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено счетчиков: {checked}, исправлено: {repaired}'))
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+from posts import search
+
+
+def create_index(apps, schema_editor):
+    search.install(schema_editor.connection, rebuild=True)
+
+
+def drop_index(apps, schema_editor):
+    if not search.is_supported(schema_editor.connection):
+        return
+    for action in ('insert', 'delete', 'update'):
+        for table in ('posts_post', 'posts_comment'):
+            schema_editor.execute(
+                f'DROP TRIGGER IF EXISTS {table}_fts_{action}')
+    schema_editor.execute('DROP TABLE IF EXISTS posts_post_fts')
+    schema_editor.execute('DROP TABLE IF EXISTS posts_comment_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
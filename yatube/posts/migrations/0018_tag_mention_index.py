@@ -0,0 +1,88 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from posts.tags import extract_mentions, extract_tags
+
+
+def fill_index(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    PostTag = apps.get_model('posts', 'PostTag')
+    Mention = apps.get_model('posts', 'Mention')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    tags = []
+    mentions = []
+    for post_id, text, pub_date in Post.objects.values_list(
+            'id', 'text', 'pub_date').iterator():
+        tags.extend(PostTag(tag=tag, post_id=post_id, pub_date=pub_date)
+                    for tag in extract_tags(text))
+        usernames = extract_mentions(text)
+        if usernames:
+            mentions.extend(
+                Mention(user_id=user_id, post_id=post_id, pub_date=pub_date)
+                for user_id in User.objects.filter(
+                    username__in=usernames).values_list('pk', flat=True))
+        if len(tags) + len(mentions) >= 1000:
+            PostTag.objects.bulk_create(tags, ignore_conflicts=True)
+            Mention.objects.bulk_create(mentions, ignore_conflicts=True)
+            tags, mentions = [], []
+    PostTag.objects.bulk_create(tags, ignore_conflicts=True)
+    Mention.objects.bulk_create(mentions, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0017_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostTag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=50, verbose_name='Хэштег')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата создания поста')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tags', to='posts.Post')),
+            ],
+            options={
+                'verbose_name': 'Хэштег',
+                'verbose_name_plural': 'Хэштеги',
+                'ordering': ['tag', '-pub_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Mention',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата создания поста')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to='posts.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Упоминание',
+                'verbose_name_plural': 'Упоминания',
+                'ordering': ['-pub_date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='posttag',
+            index=models.Index(fields=['tag', '-pub_date', '-post'], name='post_tag_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='posttag',
+            constraint=models.UniqueConstraint(fields=('tag', 'post'), name='unique_post_tag'),
+        ),
+        migrations.AddIndex(
+            model_name='mention',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='mention_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='mention',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_mention'),
+        ),
+        migrations.RunPython(fill_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:56
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def fill_pulled_authors(apps, schema_editor):
+    '''
+    Раньше автор читался напрямую, пока подписчиков больше
+    FEED_FANOUT_FOLLOWERS_LIMIT. Отметка ставится с самого раннего его
+    поста, которого нет ни в одной ленте.
+    '''
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Post = apps.get_model('posts', 'Post')
+    PulledAuthor = apps.get_model('posts', 'PulledAuthor')
+    author_ids = User.objects.annotate(
+        followers=Count('following')).filter(
+        followers__gt=settings.FEED_FANOUT_FOLLOWERS_LIMIT).values_list(
+        'pk', flat=True)
+    pulled = []
+    for author_id in author_ids.iterator():
+        since = Post.objects.filter(
+            author_id=author_id, feed_entries__isnull=True).aggregate(
+            since=Min('pub_date'))['since']
+        pulled.append(PulledAuthor(
+            author_id=author_id,
+            since=since or django.utils.timezone.now()))
+    PulledAuthor.objects.bulk_create(pulled, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0018_tag_mention_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PulledAuthor',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pulled', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('since', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Читается напрямую с')),
+            ],
+            options={
+                'verbose_name': 'Автор без раскладки по лентам',
+                'verbose_name_plural': 'Авторы без раскладки по лентам',
+            },
+        ),
+        migrations.RunPython(fill_pulled_authors, migrations.RunPython.noop),
+    ]
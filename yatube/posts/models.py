@@ -1,8 +1,11 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 from core.models import CreatedModel
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
@@ -35,13 +38,33 @@ class Post(CreatedModel):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, editable=False)
+    image_height = models.PositiveIntegerField(
+        'Высота картинки', null=True, editable=False)
+    image_format = models.CharField(
+        'Формат картинки', max_length=10, blank=True, editable=False)
+    image_size = models.PositiveIntegerField(
+        'Размер картинки в байтах', null=True, editable=False)
+    image_hash = models.CharField(
+        'SHA-256 картинки', max_length=64, blank=True, editable=False)
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
         verbose_name = 'Запись'
         verbose_name_plural = 'Записи'
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_pub_date_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date_idx'),
+            models.Index(fields=['image'], name='post_image_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -64,13 +87,28 @@ class Comment(CreatedModel):
     )
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(fields=['post', '-pub_date', '-id'],
+                         name='comment_post_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    def delete(self, *args, **kwargs):
+        '''
+        У комментариев нет сигналов удаления, чтобы с постом или автором
+        Django удалял их одним запросом. Счетчик поста при удалении
+        отдельного комментария уменьшается здесь.
+        '''
+        from .signals import count_comments
+        deleted = super().delete(*args, **kwargs)
+        count_comments(self.post_id, -1)
+        return deleted
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -83,3 +121,148 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         related_name='following'
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'],
+                                    name='unique_follow'),
+        ]
+
+
+class Counter(models.Model):
+    '''
+    Счетчик записей в области видимости (вся лента, группа, автор,
+    лента подписок). Обновляется сигналами, читается через posts.counters.
+    '''
+    scope = models.CharField(max_length=64, unique=True)
+    value = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Счетчик'
+        verbose_name_plural = 'Счетчики'
+
+    def __str__(self):
+        return f'{self.scope}: {self.value}'
+
+
+class FeedEntry(models.Model):
+    '''
+    Запись материализованной ленты подписок: пост автора, на которого
+    подписан пользователь. Заполняется при публикации поста и при
+    подписке, удаляется при отписке.
+    '''
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries'
+    )
+    pub_date = models.DateTimeField('Дата создания поста')
+
+    class Meta:
+        ordering = ['-pub_date']
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_feed_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='feed_user_pub_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.post_id}'
+
+
+class PulledAuthor(models.Model):
+    '''
+    Автор, чьи посты с момента since не раскладываются по лентам
+    подписчиков, а читаются напрямую. Заводится, когда подписчиков
+    становится больше settings.FEED_FANOUT_FOLLOWERS_LIMIT, и удаляется,
+    когда их остается не больше settings.FEED_FANOUT_RESUME_LIMIT, а
+    пропущенные посты разложены по лентам.
+    '''
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='pulled'
+    )
+    since = models.DateTimeField('Читается напрямую с', default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Автор без раскладки по лентам'
+        verbose_name_plural = 'Авторы без раскладки по лентам'
+
+    def __str__(self):
+        return f'{self.author_id}: {self.since}'
+
+
+class PostTag(models.Model):
+    '''
+    Запись обратного индекса хэштегов: #tag из текста поста. Заполняется
+    при сохранении поста, упорядочена по (tag, pub_date).
+    '''
+    tag = models.CharField('Хэштег', max_length=50)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='tags'
+    )
+    pub_date = models.DateTimeField('Дата создания поста')
+
+    class Meta:
+        ordering = ['tag', '-pub_date']
+        verbose_name = 'Хэштег'
+        verbose_name_plural = 'Хэштеги'
+        constraints = [
+            models.UniqueConstraint(fields=['tag', 'post'],
+                                    name='unique_post_tag'),
+        ]
+        indexes = [
+            models.Index(fields=['tag', '-pub_date', '-post'],
+                         name='post_tag_pub_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'#{self.tag}: {self.post_id}'
+
+
+class Mention(models.Model):
+    '''
+    Запись обратного индекса упоминаний: @username из текста поста.
+    Заполняется при сохранении поста.
+    '''
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='mentions'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='mentions'
+    )
+    pub_date = models.DateTimeField('Дата создания поста')
+
+    class Meta:
+        ordering = ['-pub_date']
+        verbose_name = 'Упоминание'
+        verbose_name_plural = 'Упоминания'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_mention'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='mention_user_pub_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'@{self.user_id}: {self.post_id}'
@@ -0,0 +1,174 @@
+import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+# Внешние индексы FTS5 по текстам постов и комментариев. Триггеры держат
+# их в согласии с таблицами; IF NOT EXISTS позволяет пересоздавать их
+# после миграций, которые пересобирают таблицы.
+SCHEMA = (
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS posts_post_fts USING fts5(
+        text, content='posts_post', content_rowid='id')''',
+    '''CREATE TRIGGER IF NOT EXISTS posts_post_fts_insert
+        AFTER INSERT ON posts_post BEGIN
+        INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS posts_post_fts_delete
+        AFTER DELETE ON posts_post BEGIN
+        INSERT INTO posts_post_fts(posts_post_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS posts_post_fts_update
+        AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO posts_post_fts(posts_post_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text);
+    END''',
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS posts_comment_fts USING fts5(
+        text, post_id UNINDEXED, content='posts_comment',
+        content_rowid='id')''',
+    '''CREATE TRIGGER IF NOT EXISTS posts_comment_fts_insert
+        AFTER INSERT ON posts_comment BEGIN
+        INSERT INTO posts_comment_fts(rowid, text, post_id)
+        VALUES (new.id, new.text, new.post_id);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS posts_comment_fts_delete
+        AFTER DELETE ON posts_comment BEGIN
+        INSERT INTO posts_comment_fts(posts_comment_fts, rowid, text, post_id)
+        VALUES ('delete', old.id, old.text, old.post_id);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS posts_comment_fts_update
+        AFTER UPDATE OF text, post_id ON posts_comment BEGIN
+        INSERT INTO posts_comment_fts(posts_comment_fts, rowid, text, post_id)
+        VALUES ('delete', old.id, old.text, old.post_id);
+        INSERT INTO posts_comment_fts(rowid, text, post_id)
+        VALUES (new.id, new.text, new.post_id);
+    END''',
+)
+REBUILD = (
+    "INSERT INTO posts_post_fts(posts_post_fts) VALUES ('rebuild')",
+    "INSERT INTO posts_comment_fts(posts_comment_fts) VALUES ('rebuild')",
+)
+
+# Совпадение в комментарии весит вдвое меньше совпадения в самом посте;
+# rank в FTS5 отрицательный, и чем он меньше, тем лучше.
+SEARCH_SQL = '''
+    SELECT post_id, MIN(rank) AS post_rank FROM (
+        SELECT rowid AS post_id, rank FROM posts_post_fts
+        WHERE posts_post_fts MATCH %s
+        UNION ALL
+        SELECT post_id, rank * 0.5 FROM posts_comment_fts
+        WHERE posts_comment_fts MATCH %s
+    )
+    GROUP BY post_id
+    HAVING post_rank > %s OR (post_rank = %s AND post_id > %s)
+    ORDER BY post_rank, post_id
+    LIMIT %s
+'''
+
+
+def is_supported(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def install(using=connection, rebuild=False):
+    '''Создаст индексы и триггеры, если их нет; rebuild переиндексирует.'''
+    if not is_supported(using):
+        return
+    with using.cursor() as cursor:
+        for statement in SCHEMA + (REBUILD if rebuild else ()):
+            cursor.execute(statement)
+
+
+def to_match(query):
+    '''
+    Превратит пользовательский запрос в выражение MATCH: каждое слово
+    ищется как отдельная фраза, так что синтаксис FTS5 не срабатывает.
+    '''
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"' for word in words)
+
+
+def encode_cursor(rank, pk):
+    return urlsafe_b64encode(f'{rank!r}|{pk}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    '''Позиция (rank, id) из токена; None для пустого или битого.'''
+    if not token:
+        return None
+    try:
+        raw = urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        rank, pk = raw.split('|')
+        return float(rank), int(pk)
+    except ValueError:
+        return None
+
+
+class SearchPage:
+    '''
+    Страница результатов поиска по ключу (rank, id) для шаблона
+    posts/includes/paginator.html: курсор идет только вперед, поэтому
+    previous_cursor пуст и назад ведет только ссылка на первую страницу.
+    '''
+    is_cursor = True
+
+    def __init__(self, object_list, next_cursor=None, first=True):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = None
+        self.first = first
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return not self.first
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+
+def search(query, cursor=None, per_page=10):
+    '''Страница постов, найденных по тексту поста или комментариев.'''
+    match = to_match(query)
+    if not match or not is_supported():
+        return SearchPage([])
+    position = decode_cursor(cursor)
+    rank, pk = position or (float('-inf'), 0)
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(SEARCH_SQL,
+                          [match, match, rank, rank, pk, per_page + 1])
+        rows = db_cursor.fetchall()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        [post_id for post_id, _ in rows])
+    next_cursor = None
+    if has_more:
+        last_id, last_rank = rows[-1]
+        next_cursor = encode_cursor(last_rank, last_id)
+    found = [posts[post_id] for post_id, _ in rows if post_id in posts]
+    return SearchPage(found, next_cursor, first=position is None)
+
+
+def filter_posts(queryset, query):
+    '''Ограничит queryset постами, текст которых совпал с запросом.'''
+    match = to_match(query)
+    if not match:
+        return queryset.none()
+    return queryset.filter(pk__in=RawSQL(
+        'SELECT rowid FROM posts_post_fts WHERE posts_post_fts MATCH %s',
+        [match]))
@@ -0,0 +1,210 @@
+from django.db import connections
+from django.db.models.signals import (post_delete, post_init, post_migrate,
+                                      post_save, pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import caching, cards, counters, feeds, images, search, tags
+from .models import Comment, Follow, Group, Post, User
+
+# Поля пользователя, которые выводятся в карточках постов.
+CARD_USER_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+def post_scopes(post):
+    '''Области видимости счетчиков, в которые входит пост.'''
+    scopes = [counters.ALL, counters.author_scope(post.author_id)]
+    if post.group_id:
+        scopes.append(counters.group_scope(post.group_id))
+    return scopes
+
+
+@receiver(post_init, sender=Post)
+def remember_initial_values(sender, instance, **kwargs):
+    instance._initial_group_id = instance.__dict__.get('group_id')
+    instance._initial_text = instance.__dict__.get('text')
+
+
+@receiver(pre_save, sender=Post)
+def store_image_metadata(sender, instance, **kwargs):
+    '''Метаданные читаются только у только что загруженного файла.'''
+    if not instance.image or not instance.image._committed:
+        images.fill_metadata(instance)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    if created:
+        counters.change(post_scopes(instance), 1)
+    elif instance.group_id != instance._initial_group_id:
+        if instance._initial_group_id:
+            counters.change(
+                [counters.group_scope(instance._initial_group_id)], -1)
+        if instance.group_id:
+            counters.change([counters.group_scope(instance.group_id)], 1)
+    instance._initial_group_id = instance.group_id
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change(post_scopes(instance), -1)
+
+
+def follow_scopes(follow):
+    return [counters.followers_scope(follow.author_id),
+            counters.following_scope(follow.user_id)]
+
+
+@receiver(post_save, sender=Follow)
+def count_follower(sender, instance, created, **kwargs):
+    if created:
+        counters.change(follow_scopes(instance), 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_unfollower(sender, instance, **kwargs):
+    counters.change(follow_scopes(instance), -1)
+
+
+def count_comments(post_id, delta):
+    counters.change([counters.comments_scope(post_id)], delta)
+    cards.invalidate([post_id])
+    caching.bump('index')
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        count_comments(instance.post_id, 1)
+
+
+@receiver(pre_delete, sender=Post)
+def remove_post_counters(sender, instance, **kwargs):
+    counters.remove([counters.comments_scope(instance.pk)])
+
+
+@receiver(post_delete, sender=Group)
+def remove_group_counter(sender, instance, **kwargs):
+    counters.remove([counters.group_scope(instance.pk)])
+
+
+def user_scopes(user_id):
+    return [counters.author_scope(user_id), counters.feed_scope(user_id),
+            counters.followers_scope(user_id),
+            counters.following_scope(user_id),
+            counters.mentions_scope(user_id)]
+
+
+@receiver(pre_delete, sender=User)
+def remember_commented_posts(sender, instance, **kwargs):
+    '''
+    Комментарии пользователя удаляются вместе с ним без сигналов, поэтому
+    посты других авторов, которые он комментировал, запоминаются заранее.
+    '''
+    instance._commented_post_ids = list(
+        Comment.objects.filter(author=instance)
+        .exclude(post__author=instance)
+        .order_by().values_list('post_id', flat=True).distinct())
+
+
+@receiver(post_delete, sender=User)
+def remove_user_counters(sender, instance, **kwargs):
+    counters.remove(user_scopes(instance.pk))
+    post_ids = getattr(instance, '_commented_post_ids', [])
+    if post_ids:
+        counters.repair(counters.comments_scope(pk) for pk in post_ids)
+        cards.invalidate(post_ids)
+        caching.bump('index')
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        feeds.fan_out(instance)
+
+
+@receiver(pre_delete, sender=Post)
+def retract_post(sender, instance, **kwargs):
+    feeds.retract(instance)
+
+
+@receiver(post_save, sender=Post)
+def index_post_tags(sender, instance, created, **kwargs):
+    if created or instance.text != instance._initial_text:
+        tags.index_post(instance, created)
+    instance._initial_text = instance.text
+
+
+@receiver(pre_delete, sender=Post)
+def unindex_post_tags(sender, instance, **kwargs):
+    tags.unindex_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def pull_author(sender, instance, created, **kwargs):
+    if created:
+        feeds.update_fan_out(instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(sender, instance, created, **kwargs):
+    if created:
+        feeds.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_feed(sender, instance, **kwargs):
+    feeds.trim(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def resume_author(sender, instance, **kwargs):
+    feeds.update_fan_out(instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def bump_index_cache(sender, **kwargs):
+    caching.bump('index')
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_card(sender, instance, **kwargs):
+    cards.invalidate([instance.pk])
+
+
+def card_user_values(user):
+    return {field: user.__dict__.get(field) for field in CARD_USER_FIELDS}
+
+
+@receiver(post_init, sender=User)
+def remember_card_user_values(sender, instance, **kwargs):
+    instance._initial_card_values = card_user_values(instance)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_cards(sender, instance, created, **kwargs):
+    '''
+    Карточки постов автора сбрасываются, только если изменилось имя из
+    карточки: сохранение пользователя без смены имени их не трогает.
+    '''
+    values = card_user_values(instance)
+    if created or values == instance._initial_card_values:
+        return
+    instance._initial_card_values = values
+    cards.invalidate(instance.posts.values_list('pk', flat=True))
+    caching.bump('index')
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    '''
+    Миграции SQLite пересобирают таблицы и теряют их триггеры; после
+    миграций они создаются заново, если индекс поиска уже заведен.
+    '''
+    connection = connections[using]
+    if (sender.name == 'posts'
+            and 'posts_post_fts' in connection.introspection.table_names()):
+        search.install(connection)
@@ -0,0 +1,49 @@
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+# Имя файла в адресуемом содержимым хранилище: SHA-256 и расширение.
+ADDRESSED_NAME = re.compile(r'(^|/)[0-9a-f]{64}(\.\w+)?$')
+
+
+def content_hash(content):
+    '''
+    SHA-256 загружаемого файла, посчитанный по частям, или уже
+    посчитанный images.read_metadata.
+    '''
+    if getattr(content, 'sha256', None):
+        return content.sha256
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    '''
+    Сохраняет файлы под именем из хэша содержимого в каталоге upload_to.
+    Повторная загрузка того же файла не пишет его заново, а возвращает
+    уже сохраненное имя, так что посты делят и файл, и его миниатюры.
+    Файлы без ссылок удаляет только collect_media, не трогая недавно
+    измененные, поэтому повторная загрузка обновляет время изменения:
+    пост с ней может быть еще не сохранен.
+    '''
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory,
+                            content_hash(content) + extension)
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+    def is_addressed(self, name):
+        return bool(ADDRESSED_NAME.search(name or ''))
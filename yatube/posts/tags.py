@@ -0,0 +1,86 @@
+import re
+
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from . import counters
+from .models import Mention, PostTag, User
+
+TAG = re.compile(r'(?<![\w#])#(?P<tag>\w{1,50})')
+MENTION = re.compile(r'(?<![\w@])@(?P<user>[\w.+-]*[\w+-])')
+LINK = re.compile(f'{TAG.pattern}|{MENTION.pattern}')
+
+
+def extract_tags(text):
+    return {tag.lower() for tag in TAG.findall(text)}
+
+
+def extract_mentions(text):
+    return set(MENTION.findall(text))
+
+
+def _sync(queryset, field, wanted, make, scope, created):
+    '''
+    Приведет записи индекса поста к wanted: удалит лишние, добавит
+    недостающие и поправит счетчики их областей видимости.
+    '''
+    current = set()
+    if not created:
+        current = set(queryset.values_list(field, flat=True))
+    stale = current - wanted
+    fresh = wanted - current
+    if stale:
+        queryset.filter(**{f'{field}__in': stale}).delete()
+        counters.change(map(scope, stale), -1)
+    if fresh:
+        queryset.model.objects.bulk_create(map(make, fresh),
+                                           ignore_conflicts=True)
+        counters.change(map(scope, fresh), 1)
+
+
+def index_post(post, created=False):
+    '''
+    Обновит хэштеги и упоминания поста по его тексту. У нового поста
+    записей индекса еще нет, и они не читаются.
+    '''
+    _sync(
+        PostTag.objects.filter(post=post), 'tag', extract_tags(post.text),
+        lambda tag: PostTag(tag=tag, post=post, pub_date=post.pub_date),
+        counters.tag_scope, created)
+    usernames = extract_mentions(post.text)
+    user_ids = set(User.objects.filter(username__in=usernames)
+                   .values_list('pk', flat=True)) if usernames else set()
+    _sync(
+        Mention.objects.filter(post=post), 'user_id', user_ids,
+        lambda user_id: Mention(user_id=user_id, post=post,
+                                pub_date=post.pub_date),
+        counters.mentions_scope, created)
+
+
+def unindex_post(post):
+    '''Уменьшит счетчики хэштегов и упоминаний удаляемого поста.'''
+    counters.change(map(counters.tag_scope, post.tags.values_list(
+        'tag', flat=True)), -1)
+    counters.change(map(counters.mentions_scope, post.mentions.values_list(
+        'user_id', flat=True)), -1)
+
+
+def _link(match):
+    if match.group('tag'):
+        url = reverse('posts:tag_posts', args=[match.group('tag').lower()])
+    else:
+        url = reverse('posts:mentions', args=[match.group('user')])
+    return f'<a href="{escape(url)}">{escape(match.group(0))}</a>'
+
+
+def linkify(text):
+    '''Экранирует текст поста и превратит #tag и @username в ссылки.'''
+    parts = []
+    position = 0
+    for match in LINK.finditer(text):
+        parts.append(escape(text[position:match.start()]))
+        parts.append(_link(match))
+        position = match.end()
+    parts.append(escape(text[position:]))
+    return mark_safe(''.join(parts))
@@ -0,0 +1,10 @@
+from django import template
+
+from posts.tags import linkify as linkify_text
+
+register = template.Library()
+
+
+@register.filter
+def linkify(text):
+    return linkify_text(text)
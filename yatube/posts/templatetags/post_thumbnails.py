@@ -0,0 +1,23 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def ready_thumbnail(image, geometry, **options):
+    '''
+    Готовая миниатюра или None, пока фоновая задача ее не создала; при
+    промахе задача ставится в очередь.
+    '''
+    thumbnail = thumbnails.lookup(image, geometry, **options)
+    if thumbnail is None:
+        thumbnails.enqueue(image)
+    return thumbnail
+
+
+@register.simple_tag
+def card_size(post):
+    '''Размер миниатюры карточки (ширина, высота) или None.'''
+    return thumbnails.card_size(post)
@@ -0,0 +1,270 @@
+# This Python file uses the following encoding: utf-8
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import override_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+
+from .. import counters, thumbnails
+from ..models import (Comment, Counter, FeedEntry, Follow, Mention, Post,
+                      PostTag)
+from ..tags import extract_mentions, extract_tags
+from .utils import TestCase, small_gif
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class RepairCountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follower')
+        Follow.objects.create(user=cls.follower, author=cls.author)
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        Comment.objects.create(author=cls.follower, post=cls.post,
+                               text='Комментарий')
+
+    def setUp(self):
+        cache.clear()
+        self.expected = {
+            counters.ALL: 1,
+            counters.author_scope(self.author.pk): 1,
+            counters.feed_scope(self.follower.pk): 1,
+            counters.followers_scope(self.author.pk): 1,
+            counters.following_scope(self.follower.pk): 1,
+            counters.comments_scope(self.post.pk): 1,
+        }
+
+    def test_repair_fixes_drifted_counters(self):
+        '''Команда исправит разошедшиеся счетчики.'''
+        counters.get_counts(self.expected)
+        Counter.objects.update(value=100)
+        out = StringIO()
+        call_command('repair_counters', stdout=out)
+        self.assertIn('исправлено: 6', out.getvalue())
+        self.assertEqual(counters.get_counts(self.expected), self.expected)
+
+    def test_repair_creates_missing_counters(self):
+        '''С флагом --create команда создаст счетчики для всех записей.'''
+        call_command('repair_counters', '--create', stdout=StringIO())
+        self.assertEqual(
+            dict(Counter.objects.filter(scope__in=self.expected)
+                 .values_list('scope', 'value')),
+            self.expected)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GenerateThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = User.objects.create_user(username='author')
+        cls.posts = [
+            Post.objects.create(
+                author=author, text=f'Пост {number}',
+                image=SimpleUploadedFile(
+                    f'small_{number}.gif', small_gif + bytes([number]),
+                    content_type='image/gif'))
+            for number in range(3)
+        ]
+        cls.missing = Post.objects.create(author=author, text='Без файла',
+                                          image='posts/missing.gif')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.checkpoint = os.path.join(TEMP_MEDIA_ROOT, 'checkpoint.json')
+
+    def generate(self):
+        out = StringIO()
+        call_command('generate_thumbnails', '--workers=0', '--batch-size=2',
+                     f'--checkpoint={self.checkpoint}', stdout=out)
+        return out.getvalue()
+
+    def ready(self, post):
+        return thumbnails.lookup(post.image, '500x100', crop='center',
+                                 upscale=False)
+
+    def test_generates_thumbnails_and_reports_failures(self):
+        '''Команда создаст миниатюры и посчитает пропавшие файлы.'''
+        output = self.generate()
+        self.assertIn('Обработано изображений: 4, ошибок: 1', output)
+        for post in self.posts:
+            self.assertIsNotNone(self.ready(post))
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_generates_thumbnails_in_process_pool(self):
+        '''С --workers миниатюры создаются в пуле процессов.'''
+        thumbnails_root = os.path.join(TEMP_MEDIA_ROOT,
+                                       thumbnail_settings.THUMBNAIL_PREFIX)
+        shutil.rmtree(thumbnails_root, ignore_errors=True)
+        out = StringIO()
+        call_command('generate_thumbnails', '--workers=2', '--batch-size=2',
+                     f'--checkpoint={self.checkpoint}', stdout=out)
+        self.assertIn('Обработано изображений: 4, ошибок: 1',
+                      out.getvalue())
+        # Процессы пишут миниатюры на диск, а записи о них - в свою копию
+        # тестовой базы в памяти, поэтому проверяются файлы.
+        names = [name for _, _, files in os.walk(thumbnails_root)
+                 for name in files]
+        self.assertEqual(len(names),
+                         len(self.posts) * len(thumbnails.GEOMETRIES))
+
+    def test_resumes_from_checkpoint(self):
+        '''Команда продолжит с поста после контрольной точки.'''
+        with open(self.checkpoint, 'w') as checkpoint:
+            checkpoint.write(f'{{"last_pk": {self.posts[0].pk}}}')
+        output = self.generate()
+        self.assertIn('Обработано изображений: 3', output)
+        self.assertIsNone(self.ready(self.posts[0]))
+        self.assertIsNotNone(self.ready(self.posts[1]))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class FillImageMetadataTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_fills_metadata_of_existing_images(self):
+        '''Команда заполнит метаданные картинок, загруженных раньше.'''
+        author = User.objects.create_user(username='author')
+        post = Post.objects.create(
+            author=author, text='Пост',
+            image=SimpleUploadedFile('old.gif', small_gif,
+                                     content_type='image/gif'))
+        Post.objects.update(image_width=None, image_hash='')
+        Post.objects.create(author=author, text='Без файла',
+                            image='posts/missing.gif')
+        out = StringIO()
+        call_command('fill_image_metadata', stdout=out)
+        self.assertIn('Заполнено картинок: 1, не прочитано: 1',
+                      out.getvalue())
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_size),
+                         (2, len(small_gif)))
+
+
+GC_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=GC_MEDIA_ROOT)
+class CollectMediaTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(GC_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, content):
+        post = Post.objects.create(
+            author=self.author, text='Пост',
+            image=SimpleUploadedFile('image.gif', content,
+                                     content_type='image/gif'))
+        thumbnails.generate(post.image)
+        return post
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.kept = self.create_post(small_gif)
+        orphan = self.create_post(small_gif + b'\0')
+        # В TestCase on_commit не срабатывает, так что файл останется.
+        orphan.delete()
+        self.orphan = orphan.image.name
+        self.stray = os.path.join(GC_MEDIA_ROOT, 'cache', 'zz', 'stray.jpg')
+        os.makedirs(os.path.dirname(self.stray), exist_ok=True)
+        with open(self.stray, 'wb') as stray:
+            stray.write(b'x' * 10)
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command('collect_media', '--min-age=0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_deletes_nothing(self):
+        '''С --dry-run команда только посчитает файлы.'''
+        self.assertIn('Будет удалено файлов: 3', self.collect('--dry-run'))
+        self.assertTrue(self.kept.image.storage.exists(self.orphan))
+        self.assertTrue(os.path.exists(self.stray))
+
+    def test_deletes_unreferenced_files(self):
+        '''Команда удалит осиротевшие оригиналы и миниатюры.'''
+        output = self.collect()
+        self.assertIn('Удалено файлов: 3', output)
+        storage = self.kept.image.storage
+        self.assertFalse(storage.exists(self.orphan))
+        self.assertFalse(os.path.exists(self.stray))
+        self.assertTrue(storage.exists(self.kept.image.name))
+        self.assertIsNotNone(thumbnails.lookup(
+            self.kept.image, *thumbnails.CARD[:1], **thumbnails.CARD[1]))
+
+
+DATASET_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=DATASET_MEDIA_ROOT,
+                   FEED_FANOUT_FOLLOWERS_LIMIT=5)
+class GenerateDatasetTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(DATASET_MEDIA_ROOT, ignore_errors=True)
+
+    def generate(self, prefix):
+        call_command(
+            'generate_dataset', '--users=30', '--groups=3', '--posts=80',
+            '--comments=120', '--follows=6', '--images=2',
+            '--image-ratio=0.5', '--seed=7', '--batch-size=25',
+            f'--prefix={prefix}', stdout=StringIO())
+        return Post.objects.filter(author__username__startswith=prefix)
+
+    def test_generates_consistent_dataset(self):
+        cache.clear()
+        posts = self.generate('gen')
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(posts.count(), 80)
+        self.assertEqual(Comment.objects.count(), 120)
+        self.assertEqual(
+            len({post.image.name for post in posts if post.image}), 2)
+        self.assertEqual(
+            PostTag.objects.count(),
+            sum(len(extract_tags(post.text)) for post in posts))
+        self.assertEqual(
+            Mention.objects.count(),
+            sum(len(extract_mentions(post.text)) for post in posts))
+        pushed = {
+            (follow.user_id, post.pk)
+            for follow in Follow.objects.all()
+            for post in posts.filter(author_id=follow.author_id)
+            if follow.author.following.count() <= 5
+        }
+        self.assertEqual(
+            set(FeedEntry.objects.values_list('user_id', 'post_id')), pushed)
+        self.assertEqual(counters.get_count(counters.ALL), 80)
+        out = StringIO()
+        call_command('repair_counters', stdout=out)
+        self.assertIn('исправлено: 0', out.getvalue())
+
+    def test_same_seed_gives_same_texts(self):
+        first = list(self.generate('one').order_by('pk').values_list(
+            'text', flat=True))
+        second = list(self.generate('two').order_by('pk').values_list(
+            'text', flat=True))
+        self.assertEqual(
+            [text.replace('@one', '@') for text in first],
+            [text.replace('@two', '@') for text in second])
@@ -1,15 +1,21 @@
 # This Python file uses the following encoding: utf-8
+import hashlib
 import shutil
 import tempfile
+import warnings
+from io import BytesIO
+from unittest import mock
 
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase, override_settings
+from django.test import Client, override_settings
 from django.urls import reverse
 from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
 
 from ..models import Post, Group, Comment
 from ..forms import PostForm
-from .utils import post_body_test, uploaded_img
+from .utils import TestCase, post_body_test, small_gif, uploaded_img
 
 
 User = get_user_model()
@@ -73,6 +79,25 @@ class PostFormTest(TestCase):
         self.assertEqual(Post.objects.count(), posts_count + 1)
         post_body_test(self,
                        make_bundle(self, form_data, Post.objects.first()))
+        post = Post.objects.first()
+        self.assertEqual(
+            (post.image_width, post.image_height, post.image_format,
+             post.image_size, post.image_hash),
+            (2, 1, 'GIF', len(small_gif),
+             hashlib.sha256(small_gif).hexdigest()))
+
+    def test_upload_hashed_once(self):
+        """Хранилище берет SHA-256, посчитанный при чтении метаданных."""
+        with mock.patch('posts.storage.hashlib') as storage_hashlib:
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Один хэш',
+                      'image': SimpleUploadedFile('small.gif', small_gif,
+                                                  content_type='image/gif')})
+        storage_hashlib.sha256.assert_not_called()
+        post = Post.objects.get(text='Один хэш')
+        self.assertEqual(post.image.name,
+                         f'posts/{post.image_hash}.gif')
 
     def test_post_edit(self):
         """Валидная форма изменяет запись Post."""
@@ -98,6 +123,65 @@ class PostFormTest(TestCase):
         post_body_test(self,
                        make_bundle(self, form_data, Post.objects.first()))
 
+    def jpeg(self, size):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'JPEG')
+        return SimpleUploadedFile('big.jpg', buffer.getvalue(),
+                                  content_type='image/jpeg')
+
+    @override_settings(IMAGE_MAX_SIDE=100)
+    def test_big_image_downscaled(self):
+        """Картинка больше IMAGE_MAX_SIDE уменьшается до сохранения."""
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Большая картинка', 'image': self.jpeg((400, 200))},
+        )
+        post = Post.objects.get(text='Большая картинка')
+        self.assertEqual(
+            (post.image_width, post.image_height, post.image_format),
+            (100, 50, 'JPEG'))
+
+    @override_settings(IMAGE_MAX_SIDE=100)
+    def test_read_only_format_downscaled_to_png(self):
+        """Картинка в формате, который Pillow не пишет, уменьшается в
+        PNG."""
+        image = self.jpeg((400, 200))
+        with mock.patch.dict(Image.SAVE):
+            del Image.SAVE['JPEG']
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Картинка PSD', 'image': image},
+            )
+        post = Post.objects.get(text='Картинка PSD')
+        self.assertEqual(
+            (post.image_width, post.image_height, post.image_format),
+            (100, 50, 'PNG'))
+
+    def test_decompression_bomb_rejected(self):
+        """Картинка больше предела пикселей не принимается."""
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 100):
+            form = PostForm(data={'text': 'Бомба'},
+                            files={'image': self.jpeg((400, 200))})
+            self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
+
+    @override_settings(IMAGE_MAX_PIXELS=50000)
+    def test_image_up_to_twice_pixel_limit_rejected(self):
+        """Картинка в 1-2 раза больше предела, на которой Pillow только
+        предупреждает, тоже не принимается и не декодируется."""
+        buffer = BytesIO()
+        Image.new('RGB', (400, 200), 'red').save(buffer, 'PNG')
+        image = SimpleUploadedFile('big.png', buffer.getvalue(),
+                                   content_type='image/png')
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 50000), \
+                mock.patch.object(Image.Image, 'load') as load, \
+                warnings.catch_warnings():
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            form = PostForm(data={'text': 'Бомба'}, files={'image': image})
+            self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
+        load.assert_not_called()
+
     def test_guest_create_post(self):
         '''Неавторизованный пользователь не может создать пост.'''
         posts_count = Post.objects.count()
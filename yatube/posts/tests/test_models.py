@@ -1,11 +1,26 @@
 # This Python file uses the following encoding: utf-8
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import F
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
-from ..models import Group, Post
+from .. import counters, feeds
+from ..models import Comment, Counter, Follow, Group, Post
+from .utils import TestCase, TransactionTestCase, small_gif
 
 User = get_user_model()
 
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
 
 class PostModelTest(TestCase):
     @classmethod
@@ -40,3 +55,176 @@ class PostModelTest(TestCase):
         for field, text in fields.items():
             with self.subTest():
                 self.assertEqual(field, text)
+
+
+class CounterModelTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='counter',
+            description='Тестовое описание',
+        )
+        Post.objects.create(author=cls.author, text='Пост в группе',
+                            group=cls.group)
+        Post.objects.create(author=cls.author, text='Пост без группы')
+
+    def setUp(self):
+        cache.clear()
+        self.scopes = [counters.ALL,
+                       counters.group_scope(self.group.pk),
+                       counters.author_scope(self.author.pk),
+                       counters.feed_scope(self.follower.pk)]
+
+    def test_counts_computed_and_stored(self):
+        '''Отсутствующие счетчики считаются по таблице и сохраняются.'''
+        self.assertEqual(counters.get_counts(self.scopes),
+                         dict(zip(self.scopes, (2, 1, 2, 0))))
+        self.assertEqual(Counter.objects.filter(scope__in=self.scopes).count(),
+                         len(self.scopes))
+        cache.clear()
+        with self.assertNumQueries(1):
+            counters.get_counts(self.scopes)
+
+    def test_counters_follow_signals(self):
+        '''Счетчики обновляются при создании, правке и удалении записей.'''
+        counters.get_counts(self.scopes)
+        Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(counters.get_counts(self.scopes),
+                         dict(zip(self.scopes, (3, 1, 3, 3))))
+        post.group = self.group
+        post.save()
+        self.assertEqual(counters.get_count(self.scopes[1]), 2)
+        post.delete()
+        Follow.objects.filter(user=self.follower).delete()
+        self.assertEqual(counters.get_counts(self.scopes),
+                         dict(zip(self.scopes, (2, 1, 2, 0))))
+        with self.assertNumQueries(0):
+            counters.get_counts(self.scopes)
+
+    def test_post_comments_deleted_in_one_query(self):
+        '''
+        Комментарии удаляются с постом одним запросом, а счетчик
+        комментариев поста удаляется вместе с ним.
+        '''
+        def delete_post(comments):
+            post = Post.objects.create(author=self.author, text='Пост')
+            Comment.objects.bulk_create(
+                Comment(post=post, author=self.follower, text='Текст')
+                for _ in range(comments))
+            scope = counters.comments_scope(post.pk)
+            self.assertEqual(counters.get_count(scope), comments)
+            with CaptureQueriesContext(connection) as queries:
+                post.delete()
+            self.assertFalse(Counter.objects.filter(scope=scope).exists())
+            return len(queries)
+
+        self.assertEqual(delete_post(200), delete_post(2))
+
+    def test_user_counters_removed_with_user(self):
+        '''
+        С пользователем удаляются его счетчики, а счетчики комментариев
+        чужих постов, которые он комментировал, пересчитываются.
+        '''
+        post = Post.objects.first()
+        Comment.objects.create(post=post, author=self.follower, text='Текст')
+        Follow.objects.create(user=self.follower, author=self.author)
+        scope = counters.comments_scope(post.pk)
+        follower_scopes = [counters.following_scope(self.follower.pk),
+                           counters.feed_scope(self.follower.pk)]
+        self.assertEqual(counters.get_counts([scope] + follower_scopes),
+                         {scope: 1, follower_scopes[0]: 1,
+                          follower_scopes[1]: 2})
+        self.follower.delete()
+        self.assertFalse(
+            Counter.objects.filter(scope__in=follower_scopes).exists())
+        self.assertEqual(counters.get_count(scope), 0)
+        self.assertEqual(
+            counters.get_count(counters.followers_scope(self.author.pk)), 0)
+
+
+class QueryPlanTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='plan',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(author=cls.user, text='Пост',
+                                       group=cls.group)
+
+    def assertUsesIndexes(self, queryset):
+        '''Проверит по EXPLAIN QUERY PLAN, что запрос читает индексы и не
+        сортирует строки во временном B-дереве.'''
+        plan = queryset.explain()
+        for line in plan.splitlines():
+            with self.subTest(query=str(queryset.query), line=line):
+                self.assertNotIn('TEMP B-TREE', line)
+                if ' SCAN ' in line:
+                    self.assertIn(' USING ', line)
+
+    def test_view_queries_use_indexes(self):
+        '''Запросы представлений используют индексы.'''
+        queries = (
+            Post.objects.select_related('author', 'group'),
+            self.group.posts.select_related('author'),
+            self.user.posts.select_related('group', 'author'),
+            self.post.comments.select_related('author'),
+            feeds.timeline(self.user).pushed,
+            Post.objects.filter(tags__tag='тег').order_by(
+                F('tags__pub_date').desc(), F('tags__post_id').desc()),
+            Post.objects.filter(mentions__user=self.user).order_by(
+                F('mentions__pub_date').desc(),
+                F('mentions__post_id').desc()),
+        )
+        for queryset in queries:
+            self.assertUsesIndexes(queryset[:10])
+        self.assertUsesIndexes(
+            Follow.objects.filter(user=self.user, author=self.user))
+        self.assertUsesIndexes(Counter.objects.filter(scope__in=['all']))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedImageTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, filename):
+        return Post.objects.create(
+            author=self.author, text='Пост',
+            image=SimpleUploadedFile(filename, small_gif,
+                                     content_type='image/gif'))
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+
+    def test_same_content_is_stored_once(self):
+        '''Одинаковые картинки хранятся одним файлом по хэшу.'''
+        first = self.create_post('first.gif')
+        second = self.create_post('second.GIF')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(first.image.name,
+                         f'posts/{first.image_hash}.gif')
+
+    def test_unreferenced_file_is_kept_for_collect_media(self):
+        '''Файл без ссылок остается до collect_media, а повторная загрузка
+        защищает его от удаления как свежий.'''
+        first = self.create_post('first.gif')
+        storage = first.image.storage
+        path = storage.path(first.image.name)
+        hour_ago = time.time() - 60 * 60
+        os.utime(path, (hour_ago, hour_ago))
+        first.delete()
+        self.assertTrue(storage.exists(first.image.name))
+        second = self.create_post('second.gif')
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertGreater(os.path.getmtime(path), hour_ago + 60)
@@ -0,0 +1,91 @@
+# This Python file uses the following encoding: utf-8
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Counter, FeedEntry, Follow, Group, Post
+from .utils import TestCase
+
+User = get_user_model()
+
+SIZES = (10, 100, 1000)
+
+# Наибольшее число запросов к базе на один показ страницы при холодном
+# кэше и пустой таблице счетчиков, включая сессию и пользователя.
+QUERY_BUDGETS = {
+    'posts:index': 9,
+    'posts:group_posts': 10,
+    'posts:profile': 13,
+    'posts:post_detail': 7,
+    'posts:follow_index': 13,
+}
+
+
+class QueryBudgetTest(TestCase):
+    '''Число запросов представлений не зависит от количества записей.'''
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='budget',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(author=cls.author, text='Пост',
+                                       group=cls.group)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.addresses = {
+            'posts:index': reverse('posts:index'),
+            'posts:group_posts': reverse('posts:group_posts',
+                                         args=[cls.group.slug]),
+            'posts:profile': reverse('posts:profile',
+                                     args=[cls.author.username]),
+            'posts:post_detail': reverse('posts:post_detail',
+                                         args=[cls.post.pk]),
+            'posts:follow_index': reverse('posts:follow_index'),
+        }
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def grow_to(self, size):
+        '''Доведет число постов автора и комментариев к посту до size.'''
+        missing = size - Post.objects.count()
+        posts = Post.objects.bulk_create(
+            Post(author=self.author, group=self.group, text=f'Пост {i}')
+            for i in range(missing))
+        FeedEntry.objects.bulk_create(
+            FeedEntry(user=self.reader, post=post, pub_date=post.pub_date)
+            for post in Post.objects.filter(pk__in=[p.pk for p in posts]))
+        Comment.objects.bulk_create(
+            Comment(author=self.reader, post=self.post, text=f'Ком {i}')
+            for i in range(size - self.post.comments.count()))
+
+    def count_queries(self, address):
+        cache.clear()
+        Counter.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(address)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        '''Представления укладываются в бюджет запросов при 10, 100 и
+        1000 записях.'''
+        counts = {name: set() for name in self.addresses}
+        for size in SIZES:
+            self.grow_to(size)
+            for name, address in self.addresses.items():
+                count = self.count_queries(address)
+                counts[name].add(count)
+                with self.subTest(view=name, rows=size):
+                    self.assertLessEqual(count, QUERY_BUDGETS[name])
+        for name, values in counts.items():
+            with self.subTest(view=name):
+                self.assertEqual(len(values), 1, values)
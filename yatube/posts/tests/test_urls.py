@@ -2,9 +2,10 @@
 from http import HTTPStatus
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase, Client
+from django.test import Client
 
 from ..models import Group, Post
+from .utils import TestCase
 
 
 User = get_user_model()
@@ -1,17 +1,27 @@
 # This Python file uses the following encoding: utf-8
+from http import HTTPStatus
 import shutil
 import tempfile
+from io import BytesIO
+from types import SimpleNamespace
+from unittest import mock
 
+from django.contrib.admin.sites import site
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.test import TestCase, Client, override_settings
+from django.test import Client, override_settings
 from django.urls import reverse
 from django.conf import settings
 from django import forms
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+from sorl.thumbnail import default
 
-from ..models import Group, Post, Comment, Follow
-from .utils import (post_body_test, view_bundle, reverse_ad, uploaded_img,
-                    get_follow_model)
+from .. import feeds, thumbnails
+from ..models import (Group, Post, Comment, Follow, FeedEntry, Mention,
+                      PulledAuthor)
+from .utils import (TestCase, post_body_test, view_bundle, reverse_ad,
+                    uploaded_img, get_follow_model)
 
 
 User = get_user_model()
@@ -140,26 +150,195 @@ class PostsTests(TestCase):
         )
         response = self.authorized_client.get(
             reverse_ad(*self.POST[1]))
-        self.assertEqual(response.context['comments'].first(), comment)
+        self.assertEqual(response.context['comments'][0], comment)
+
+    def test_thumbnail_placeholder_until_generated(self):
+        """Пока миниатюра не создана, вместо нее выводится заглушка."""
+        cache.clear()
+        address = reverse_ad(*self.POST[1])
+        response = self.authorized_client.get(address)
+        self.assertContains(response, 'thumbnail-placeholder.svg')
+        thumbnails.generate(self.post.image)
+        thumbnail = thumbnails.lookup(self.post.image, '500x100',
+                                      crop='center', upscale=False)
+        self.assertIsNotNone(thumbnail)
+        response = self.authorized_client.get(address)
+        self.assertNotContains(response, 'thumbnail-placeholder.svg')
+        self.assertContains(response, thumbnail.url)
+
+    def test_image_size_from_stored_metadata(self):
+        """Размеры <img> берутся из метаданных поста, пока миниатюры нет."""
+        cache.clear()
+        for address in (self.POST[1], self.INDEX[1]):
+            response = self.authorized_client.get(reverse_ad(*address))
+            self.assertContains(response, 'width="2" height="1"')
+
+    def test_card_size_matches_thumbnail(self):
+        """card_size совпадает с размером миниатюры, созданной sorl."""
+        for size in ((800, 300), (300, 800), (200, 50), (600, 100)):
+            buffer = BytesIO()
+            Image.new('RGB', size, 'red').save(buffer, 'JPEG')
+            post = Post.objects.create(
+                author=self.user, text=f'{size}',
+                image=SimpleUploadedFile('image.jpg', buffer.getvalue()))
+            thumbnails.make(post.image, [thumbnails.CARD])
+            geometry, options = thumbnails.CARD
+            thumbnail = thumbnails.lookup(post.image, geometry, **options)
+            with self.subTest(size=size):
+                self.assertEqual(thumbnails.card_size(post),
+                                 (thumbnail.width, thumbnail.height))
+
+    def test_missing_thumbnail_is_queued_once(self):
+        """Промах миниатюры ставит задачу в очередь один раз."""
+        cache.clear()
+        with mock.patch('posts.background.transaction.on_commit') as queued:
+            self.authorized_client.get(reverse_ad(*self.POST[1]))
+            self.authorized_client.get(reverse_ad(*self.INDEX[1]))
+            self.authorized_client.get(reverse_ad(*self.POST[1]))
+        queued.assert_called_once()
+        queued.call_args[0][0]()
+        self.assertIsNotNone(thumbnails.lookup(
+            self.post.image, '500x100', crop='center', upscale=False))
+
+    def test_thumbnails_resolved_in_one_query(self):
+        """Миниатюры страницы разрешаются одним запросом, промахи не
+        кэшируются."""
+        cache.clear()
+        thumbnails.generate(self.post.image)
+        cache.clear()
+        missing = Post(author=self.user, image='posts/missing.gif').image
+        with self.assertNumQueries(1):
+            thumbs = thumbnails.resolve([self.post.image, missing],
+                                        thumbnails.GEOMETRIES)
+        geometry, options = thumbnails.CARD
+        self.assertEqual(thumbs[self.post.image.name][0].url,
+                         thumbnails.lookup(self.post.image, geometry,
+                                           **options).url)
+        self.assertEqual(thumbs[missing.name],
+                         [None] * len(thumbnails.GEOMETRIES))
+        with self.assertNumQueries(0):
+            thumbnails.resolve([self.post.image], thumbnails.GEOMETRIES)
+        with self.assertNumQueries(1):
+            thumbnails.resolve([missing], thumbnails.GEOMETRIES)
+
+    def test_thumbnail_made_elsewhere_is_seen(self):
+        """Миниатюра, созданная после промаха в обход кэша этого процесса
+        (другим процессом), видна сразу."""
+        cache.clear()
+        geometry, options = thumbnails.CARD
+        thumbnail = thumbnails.thumbnail_file(self.post.image, geometry,
+                                              **options)
+        # Сам sorl кэширует промах надолго.
+        self.assertIsNone(default.kvstore.get(thumbnail))
+        self.assertIsNone(
+            thumbnails.lookup(self.post.image, geometry, **options))
+        with mock.patch.object(default.kvstore.cache, 'set'):
+            thumbnails.make(self.post.image, [thumbnails.CARD])
+        self.assertIsNotNone(
+            thumbnails.lookup(self.post.image, geometry, **options))
+
+    def test_thumbnail_sources_group_variants_by_format(self):
+        """Готовые варианты группируются в srcset по форматам."""
+        variants = (('WEBP', '250x50', {}), ('WEBP', '500x100', {}),
+                    ('AVIF', '250x50', {}))
+        thumbs = [SimpleNamespace(url='/a.webp', width=250),
+                  SimpleNamespace(url='/b.webp', width=500),
+                  None]
+        with mock.patch.object(thumbnails, 'VARIANTS', variants):
+            self.assertEqual(thumbnails.sources(thumbs), [{
+                'type': 'image/webp',
+                'srcset': '/a.webp 250w, /b.webp 500w',
+            }])
+
+    @override_settings(COMMENTS_PER_PAGE=2)
+    def test_post_comments_load_more(self):
+        """Комментарии сверх первой страницы подгружаются фрагментом."""
+        comments = [
+            Comment.objects.create(author=self.user, post=self.post,
+                                   text=f'Комментарий {number}')
+            for number in range(3)
+        ]
+        response = self.authorized_client.get(reverse_ad(*self.POST[1]))
+        first_page = response.context['comments']
+        self.assertEqual(list(first_page), comments[:0:-1])
+        self.assertTrue(first_page.has_next())
+        response = self.authorized_client.get(
+            reverse('posts:post_comments', args=[self.post.id]),
+            {'cursor': first_page.next_cursor})
+        self.assertEqual(list(response.context['comments']), comments[:1])
+        self.assertFalse(response.context['comments'].has_next())
+        self.assertNotContains(response, 'data-comments-more')
+        response = self.authorized_client.get(
+            reverse('posts:post_comments', args=[self.post.id + 1000]))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
 
     def test_index_cache(self):
-        """Главная страница кэшируется"""
+        """Главная страница кэшируется и сбрасывается при записи постов."""
+        cache.clear()
         response_first = self.authorized_client.get(reverse_ad(*self.INDEX[1]))
-        Post.objects.create(
-            author=self.user,
-            text='пост для проверки кэша',
-        )
+        Post.objects.filter(pk=self.post.pk).update(text='текст без сигнала')
         response_second = self.authorized_client.get(
             reverse_ad(*self.INDEX[1])
         )
         self.assertEqual(response_first.content,
                          response_second.content)
-        cache.clear()
-        response_after_clear = self.authorized_client.get(
+        Post.objects.create(
+            author=self.user,
+            text='пост для проверки кэша',
+        )
+        response_after_create = self.authorized_client.get(
             reverse_ad(*self.INDEX[1])
         )
-        self.assertNotEqual(response_first.content,
-                            response_after_clear.content)
+        self.assertIn('пост для проверки кэша',
+                      response_after_create.content.decode())
+
+    def test_index_cache_reset_by_comments(self):
+        """Новый и удаленный комментарий обновляют счетчик на главной."""
+        cache.clear()
+        address = reverse_ad(*self.INDEX[1])
+        self.assertContains(self.authorized_client.get(address),
+                            'Комментариев: 0')
+        comment = Comment.objects.create(author=self.user, post=self.post,
+                                         text='Комментарий')
+        self.assertContains(self.authorized_client.get(address),
+                            'Комментариев: 1')
+        comment.delete()
+        self.assertContains(self.authorized_client.get(address),
+                            'Комментариев: 0')
+
+    def test_index_cache_key_depends_on_page_and_user(self):
+        """Кэш главной страницы учитывает номер страницы и авторизацию."""
+        cache.clear()
+        for i in range(10):
+            Post.objects.create(author=self.user, text=f'Пост {i}')
+        first_page = self.authorized_client.get(reverse_ad(*self.INDEX[1]))
+        second_page = self.authorized_client.get(
+            reverse_ad(*self.INDEX[1]) + '?page=2')
+        guest_page = Client().get(reverse_ad(*self.INDEX[1]))
+        self.assertIn(self.post.text, second_page.content.decode())
+        self.assertNotIn(self.post.text, first_page.content.decode())
+        self.assertNotIn('Избранные авторы', guest_page.content.decode())
+
+    def test_post_cards_cache(self):
+        """Карточки постов кэшируются и сбрасываются при правке."""
+        cache.clear()
+        address = reverse_ad(*self.GROUP[1])
+        self.authorized_client.get(address)
+        Post.objects.filter(pk=self.post.pk).update(text='текст без сигнала')
+        self.assertIn(self.post.text,
+                      self.authorized_client.get(address).content.decode())
+        self.authorized_client.post(
+            reverse_ad(*self.EDIT[1]),
+            {'text': 'исправленный текст', 'group': self.group.pk})
+        self.assertIn('исправленный текст',
+                      self.authorized_client.get(address).content.decode())
+        with mock.patch('posts.cards.invalidate') as invalidate:
+            self.user.save()
+        invalidate.assert_not_called()
+        self.user.first_name = 'Новое имя'
+        self.user.save()
+        self.assertIn('Новое имя',
+                      self.authorized_client.get(address).content.decode())
 
 
 class PaginatorViewsTest(TestCase):
@@ -187,6 +366,34 @@ class PaginatorViewsTest(TestCase):
             'posts:index') + '?page=2')
         self.assertEqual(len(response.context['page_obj']), 3)
 
+    @override_settings(CURSOR_PAGINATION_VIEWS=['posts:index'])
+    def test_cursor_pages_navigation(self):
+        '''Проверит переходы вперед и назад курсорного паджинатора.'''
+        cache.clear()
+        first_page = self.authorized_client.get(
+            reverse('posts:index')).context['page_obj']
+        self.assertTrue(first_page.is_cursor)
+        self.assertEqual(list(first_page), self.posts[:2:-1])
+        self.assertFalse(first_page.has_previous())
+        cache.clear()
+        second_page = self.authorized_client.get(
+            reverse('posts:index'),
+            {'cursor': first_page.next_cursor}).context['page_obj']
+        self.assertEqual(list(second_page), self.posts[2::-1])
+        self.assertFalse(second_page.has_next())
+        cache.clear()
+        previous_page = self.authorized_client.get(
+            reverse('posts:index'),
+            {'cursor': second_page.previous_cursor}).context['page_obj']
+        self.assertEqual(list(previous_page), list(first_page))
+
+    @override_settings(CURSOR_PAGINATION_VIEWS=['posts:index'])
+    def test_broken_cursor_returns_first_page(self):
+        '''Поврежденный курсор вернет первую страницу.'''
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'cursor': 'не курсор'})
+        self.assertEqual(len(response.context['page_obj']), 10)
+
 
 class SubscribeViewsTest(TestCase):
     @classmethod
@@ -254,3 +461,198 @@ class SubscribeViewsTest(TestCase):
             reverse('posts:follow_index')
         )
         self.assertFalse(response_no_follow_user.context['page_obj'])
+
+    def test_feed_entries_follow_subscriptions(self):
+        '''Лента подписок материализуется при подписке и публикации.'''
+        Follow.objects.create(user=self.user_follower, author=self.user_author)
+        new_post = Post.objects.create(author=self.user_author,
+                                       text='Новый пост автора')
+        self.assertEqual(
+            list(FeedEntry.objects.filter(user=self.user_follower)
+                 .values_list('post', flat=True)),
+            [new_post.pk, self.post.pk]
+        )
+        self.auth_follower.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': self.user_author.username})
+        )
+        self.assertFalse(FeedEntry.objects.filter(user=self.user_follower))
+
+    @override_settings(FEED_FANOUT_FOLLOWERS_LIMIT=1,
+                       FEED_FANOUT_RESUME_LIMIT=0)
+    def test_hybrid_feed_merges_pulled_authors(self):
+        '''Посты популярных авторов читаются напрямую и сливаются в ленту.'''
+        cache.clear()
+        Follow.objects.create(user=self.user_no_follow,
+                              author=self.user_author)
+        Follow.objects.create(user=self.user_follower,
+                              author=self.user_author)
+        Follow.objects.create(user=self.user_follower,
+                              author=self.user_no_follow)
+        posts = [Post.objects.create(author=author, text=f'Пост {i}')
+                 for i, author in enumerate(
+                     (self.user_author, self.user_no_follow) * 6)]
+        self.assertFalse(FeedEntry.objects.filter(
+            user=self.user_follower, post__in=posts[::2]))
+        response = self.auth_follower.get(reverse('posts:follow_index'))
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.paginator.count, 14)
+        self.assertEqual(list(page_obj), posts[:1:-1])
+        response = self.auth_follower.get(
+            reverse('posts:follow_index') + '?page=2')
+        self.assertEqual(list(response.context['page_obj']),
+                         [*posts[1::-1], self.post_no_follow, self.post])
+
+        self.assertEqual(list(feeds.timeline(self.user_no_follow)[:20]),
+                         [*posts[-2::-2], self.post])
+        self.assertEqual(feeds.timeline(self.user_no_follow).count(), 7)
+
+    @override_settings(FEED_FANOUT_FOLLOWERS_LIMIT=2,
+                       FEED_FANOUT_RESUME_LIMIT=1)
+    def test_feed_backfilled_when_author_drops_under_limit(self):
+        '''Посты, опубликованные выше лимита, раскладываются в фоне, когда
+        у автора остается не больше FEED_FANOUT_RESUME_LIMIT подписчиков.'''
+        cache.clear()
+        reader = User.objects.create_user(username='reader')
+        for user in (self.user_no_follow, self.user_follower, reader):
+            Follow.objects.create(user=user, author=self.user_author)
+        self.assertTrue(PulledAuthor.objects.filter(
+            author=self.user_author).exists())
+        post = Post.objects.create(author=self.user_author, text='Пост')
+        self.assertEqual(list(FeedEntry.objects.filter(
+            user=reader).values_list('post', flat=True)), [self.post.pk])
+        with mock.patch('posts.background.transaction.on_commit') as queued:
+            Follow.objects.get(user=reader).delete()
+            queued.assert_not_called()
+            Follow.objects.get(user=self.user_follower).delete()
+            queued.assert_called_once()
+            queued.call_args[0][0]()
+        self.assertFalse(PulledAuthor.objects.exists())
+        timeline = feeds.timeline(self.user_no_follow)
+        self.assertEqual(timeline.pulled_ids, [])
+        self.assertEqual(list(timeline[:10]), [post, self.post])
+        self.assertEqual(timeline.count(), 2)
+
+    @override_settings(FEED_FANOUT_FOLLOWERS_LIMIT=2,
+                       FEED_FANOUT_RESUME_LIMIT=0)
+    def test_author_near_limit_stays_pulled(self):
+        '''Подписки и отписки между лимитами не переключают автора.'''
+        cache.clear()
+        reader = User.objects.create_user(username='reader')
+        for user in (self.user_no_follow, self.user_follower, reader):
+            Follow.objects.create(user=user, author=self.user_author)
+        with mock.patch('posts.background.transaction.on_commit') as queued:
+            for _ in range(3):
+                Follow.objects.get(user=reader).delete()
+                Follow.objects.create(user=reader, author=self.user_author)
+            Follow.objects.get(user=reader).delete()
+            Follow.objects.get(user=self.user_follower).delete()
+        queued.assert_not_called()
+        self.assertTrue(PulledAuthor.objects.filter(
+            author=self.user_author).exists())
+
+
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.in_text = Post.objects.create(author=cls.user,
+                                          text='Рыжий котик спит')
+        cls.in_comment = Post.objects.create(author=cls.user,
+                                             text='Фото с дачи')
+        Comment.objects.create(author=cls.user, post=cls.in_comment,
+                               text='Какой котик!')
+        Post.objects.create(author=cls.user, text='Про собак')
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('posts:search'),
+                                   {'q': query, **params})
+        return response, response.context['page_obj']
+
+    def test_search_ranks_post_text_above_comments(self):
+        '''Совпадение в тексте поста выше совпадения в комментарии.'''
+        _, page_obj = self.search('котик')
+        self.assertEqual(list(page_obj), [self.in_text, self.in_comment])
+
+    def test_search_index_follows_updates(self):
+        '''Индекс обновляется и при изменении записей мимо модели.'''
+        Post.objects.filter(pk=self.in_text.pk).update(text='Рыжий кот')
+        _, page_obj = self.search('котик')
+        self.assertEqual(list(page_obj), [self.in_comment])
+
+    def test_search_ignores_query_syntax(self):
+        '''Синтаксис FTS5 в запросе не ломает поиск.'''
+        response, page_obj = self.search('"котик* (')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(page_obj), 2)
+
+    def test_search_cursor_pages_keep_query(self):
+        '''Следующая страница ищется по курсору с тем же запросом.'''
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'котик номер {number}')
+            for number in range(10))
+        response, page_obj = self.search('котик')
+        self.assertEqual(len(page_obj), 10)
+        self.assertContains(
+            response, f'?q=%D0%BA%D0%BE%D1%82%D0%B8%D0%BA&amp;cursor='
+                      f'{page_obj.next_cursor}')
+        response, next_page = self.search('котик',
+                                          cursor=page_obj.next_cursor)
+        self.assertEqual(len(next_page), 2)
+        self.assertContains(response, 'Первая')
+        self.assertNotContains(response, 'Предыдущая')
+        self.assertFalse(set(page_obj) & set(next_page))
+
+    def test_admin_search_uses_index(self):
+        '''Поиск в админке идет через тот же индекс.'''
+        queryset, distinct = site._registry[Post].get_search_results(
+            None, Post.objects.all(), 'котик')
+        self.assertEqual(list(queryset), [self.in_text])
+        self.assertIn('posts_post_fts', str(queryset.query))
+
+
+class TagViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=self.author, text='Смотри, @reader: #Котики & <b>')
+
+    def test_tag_and_mention_pages(self):
+        '''Страницы хэштега и упоминаний читаются из индекса.'''
+        response = self.client.get(
+            reverse('posts:tag_posts', args=['котики']))
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+        self.assertEqual(response.context['page_obj'].paginator.count, 1)
+        response = self.client.get(
+            reverse('posts:mentions', args=[self.reader.username]))
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+
+    def test_edit_reindexes_post(self):
+        '''После правки текста пост пропадает со страницы старого тега.'''
+        self.post.text = '#собаки'
+        self.post.save()
+        response = self.client.get(
+            reverse('posts:tag_posts', args=['котики']))
+        self.assertEqual(list(response.context['page_obj']), [])
+        self.assertEqual(response.context['page_obj'].paginator.count, 0)
+        self.assertFalse(Mention.objects.exists())
+
+    def test_text_links_tags_and_mentions(self):
+        '''Хэштеги и упоминания в тексте становятся ссылками.'''
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk]))
+        tag_url = reverse('posts:tag_posts', args=['котики'])
+        self.assertContains(response, f'<a href="{tag_url}">#Котики</a>')
+        mention_url = reverse('posts:mentions', args=['reader'])
+        self.assertContains(response, f'<a href="{mention_url}">@reader</a>')
+        self.assertContains(response, '&amp; &lt;b&gt;')
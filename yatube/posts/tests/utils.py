@@ -1,8 +1,66 @@
+import os
+import shutil
+import tempfile
+
+from django import test
+from django.conf import settings
+from django.core.cache import cache
+from django.test import override_settings
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 
+from core import metrics
 from ..models import Follow
 
+# Тесты пишут в свой кэш в памяти процесса и в свой каталог показателей,
+# а не в кэш и каталоги сайта. Кэш в памяти общий для всех классов тестов,
+# поэтому очищается перед данными каждого класса.
+TEST_SETTINGS = {
+    'CACHES': {
+        'default': {
+            'BACKEND': 'core.cache.InstrumentedCache',
+            'INNER_BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    },
+    'METRICS_DIR': os.path.join(tempfile.gettempdir(),
+                                f'yatube-test-metrics-{os.getpid()}'),
+}
+
+
+def remove_test_files():
+    '''
+    Забудет показатели тестовых запросов и удалит их файлы, пока действуют
+    TEST_SETTINGS, чтобы при выходе они не попали в каталог сайта.
+    '''
+    metrics.registry().views.clear()
+    shutil.rmtree(settings.METRICS_DIR, ignore_errors=True)
+
+
+@override_settings(**TEST_SETTINGS)
+class TestCase(test.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cache.clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        remove_test_files()
+        super().tearDownClass()
+
+
+@override_settings(**TEST_SETTINGS)
+class TransactionTestCase(test.TransactionTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cache.clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        remove_test_files()
+        super().tearDownClass()
+
 
 def post_body_test(self, bundle):
     for first, second in bundle:
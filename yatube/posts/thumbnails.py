@@ -0,0 +1,204 @@
+import logging
+
+from django.core.cache import cache
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS
+from sorl.thumbnail.conf import defaults, settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    EMPTY_VALUE, KVStore as CachedDBKVStore)
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core import tracing
+
+from . import background, caching, cards
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Миниатюры, которые выводятся в шаблонах карточки и страницы поста.
+CARD = ('500x100', {'crop': 'center', 'upscale': False})
+# Ширины адаптивных вариантов карточки с теми же пропорциями и форматы
+# для них в порядке предпочтения.
+VARIANT_WIDTHS = (250, 500, 1000)
+VARIANT_FORMATS = ('AVIF', 'WEBP')
+
+
+def supported_formats():
+    '''Форматы вариантов, которые умеют записывать и Pillow, и sorl.'''
+    Image.init()
+    return [image_format for image_format in VARIANT_FORMATS
+            if image_format in Image.SAVE and image_format in EXTENSIONS]
+
+
+def card_variants():
+    '''Варианты карточки: (формат, geometry, опции) на каждую ширину.'''
+    geometry, options = CARD
+    width, height = map(int, geometry.split('x'))
+    return tuple(
+        (image_format, f'{size}x{height * size // width}',
+         dict(options, format=image_format))
+        for image_format in supported_formats() for size in VARIANT_WIDTHS
+    )
+
+
+def card_size(post):
+    '''
+    Размер миниатюры CARD по сохраненным размерам картинки поста, как
+    его посчитает sorl: масштаб по большему из отношений и обрезка до
+    geometry. Файл не открывается; None, если размеры неизвестны.
+    '''
+    if not post.image_width or not post.image_height:
+        return None
+    geometry, options = CARD
+    box_width, box_height = map(int, geometry.split('x'))
+    width, height = post.image_width, post.image_height
+    factor = max(box_width / width, box_height / height)
+    if factor < 1 or options['upscale']:
+        width, height = round(width * factor), round(height * factor)
+    return min(width, box_width), min(height, box_height)
+
+
+VARIANTS = card_variants()
+GEOMETRIES = (CARD,) + tuple(
+    (geometry, options) for _, geometry, options in VARIANTS)
+
+# Сколько секунд задача создания миниатюр файла считается поставленной.
+PENDING_TIMEOUT = 10 * 60
+
+
+def make(image, geometries=GEOMETRIES):
+    '''
+    Создаст миниатюры image по geometries. Вернет False, если хотя бы
+    одну создать не удалось: файл пропал или не читается как картинка.
+    '''
+    done = True
+    for geometry, options in geometries:
+        try:
+            with tracing.span('thumbnail', 'thumbnail', image=image.name,
+                              geometry=geometry):
+                thumbnail = get_thumbnail(image, geometry, **options)
+            done = thumbnail.exists() and done
+        except Exception:
+            logger.exception('Не удалось создать миниатюру %s для %s',
+                             geometry, image)
+            done = False
+    return done
+
+
+def generate(image):
+    '''Создаст все миниатюры изображения и сбросит карточки его постов.'''
+    make(image)
+    cards.invalidate(
+        Post.objects.filter(image=image.name).values_list('pk', flat=True))
+    caching.bump('index')
+
+
+def pending_key(name):
+    return f'thumbnails:pending:{name}'
+
+
+def enqueue(image):
+    '''
+    Поставит создание миниатюр image в фоновый пул после фиксации
+    транзакции. Повторная постановка того же файла в течение
+    PENDING_TIMEOUT пропускается, так что промахи при каждом просмотре
+    не плодят задач, а потерянная задача будет поставлена снова.
+    '''
+    if not image or not cache.add(pending_key(image.name), True,
+                                  PENDING_TIMEOUT):
+        return
+    background.run_on_commit(generate, image)
+
+
+def thumbnail_file(image, geometry, **options):
+    '''
+    Файл миниатюры image с теми же именем и ключом, что дает
+    get_thumbnail. Само изображение при этом не открывается.
+    '''
+    backend = default.backend
+    source = ImageFile(image)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def lookup(image, geometry, **options):
+    '''
+    Вернет готовую миниатюру или None, если она еще не создана.
+    '''
+    if not image:
+        return None
+    return resolve([image], [(geometry, options)])[image.name][0]
+
+
+def resolve(images, geometries):
+    '''
+    Вернет словарь имя изображения -> список готовых миниатюр (или None)
+    по geometries для всех images одним get_many к кэшу sorl и одним
+    запросом к его таблице. В отличие от sorl промахи не кэшируются:
+    миниатюру может создать другой процесс, и ее нужно увидеть сразу.
+    '''
+    images = [image for image in images if image]
+    with tracing.span('thumbnails.resolve', 'thumbnail', images=len(images)):
+        return _resolve(images, geometries)
+
+
+def _resolve(images, geometries):
+    if not isinstance(default.kvstore, CachedDBKVStore):
+        return {image.name: [
+            default.kvstore.get(thumbnail_file(image, geometry, **options))
+            for geometry, options in geometries
+        ] for image in images}
+    keys = {
+        image.name: [
+            add_prefix(thumbnail_file(image, geometry, **options).key)
+            for geometry, options in geometries
+        ]
+        for image in images
+    }
+    all_keys = [key for image_keys in keys.values() for key in image_keys]
+    kv_cache = default.kvstore.cache
+    # Промах, закэшированный самим sorl, тоже перепроверяется по таблице.
+    values = {key: value for key, value in kv_cache.get_many(all_keys).items()
+              if value != EMPTY_VALUE}
+    missing = [key for key in all_keys if key not in values]
+    if missing:
+        stored = dict(KVStoreModel.objects.filter(key__in=missing)
+                      .values_list('key', 'value'))
+        kv_cache.set_many(stored, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(stored)
+    return {name: [_deserialize(values.get(key)) for key in image_keys]
+            for name, image_keys in keys.items()}
+
+
+def _deserialize(value):
+    if value is None or value == EMPTY_VALUE:
+        return None
+    return deserialize_image_file(value)
+
+
+def sources(thumbs):
+    '''
+    Сгруппирует готовые варианты VARIANTS в атрибуты <source> тега
+    <picture>: MIME-тип и srcset с фактической шириной файлов.
+    '''
+    srcsets = {}
+    for (image_format, _, _), thumb in zip(VARIANTS, thumbs):
+        if thumb is not None:
+            srcsets.setdefault(image_format, {})[thumb.width] = thumb.url
+    return [
+        {'type': f'image/{image_format.lower()}',
+         'srcset': ', '.join(f'{url} {width}w'
+                             for width, url in sorted(srcset.items()))}
+        for image_format, srcset in srcsets.items()
+    ]
@@ -9,9 +9,15 @@ app_name = 'posts'
 urlpatterns = [
     path('', views.index,
          name='index'),
+    path('search/', views.search_posts, name='search'),
     path('group/<slug>/', views.group_posts, name='group_posts'),
+    path('tags/<str:tag>/', views.tag_posts, name='tag_posts'),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path('profile/<str:username>/mentions/', views.mentions,
+         name='mentions'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path('posts/<int:post_id>/comments/', views.post_comments,
+         name='post_comments'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('posts/<int:post_id>/comment/', views.add_comment,
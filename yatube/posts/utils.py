@@ -1,8 +1,161 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from itertools import islice
+
+from django.conf import settings
 from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from . import counters
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def batches(iterable, size):
+    '''Разобьет iterable на списки по size элементов, не читая его целиком.'''
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class CountedPaginator(Paginator):
+    '''
+    Паджинатор, который берет общее количество записей из счетчика
+    posts.counters вместо SELECT COUNT(*).
+    '''
+    def __init__(self, object_list, per_page, count_scope=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_scope = count_scope
 
+    @cached_property
+    def count(self):
+        if self.count_scope is None:
+            return super().count
+        return counters.get_count(self.count_scope)
 
-def paginator(request, post_list, posts_per_page=10):
-    '''Вернет паджинатор из входящего списка постов.'''
-    paginator = Paginator(post_list, posts_per_page)
+
+def paginator(request, post_list, posts_per_page=10, count_scope=None):
+    '''
+    Вернет страницу паджинатора из входящего списка постов. Для
+    представлений из settings.CURSOR_PAGINATION_VIEWS вернет страницу
+    курсорного паджинатора. Если передан count_scope, количество постов
+    берется из счетчика этой области видимости.
+    '''
+    match = request.resolver_match
+    if match and match.view_name in settings.CURSOR_PAGINATION_VIEWS:
+        return cursor_paginator(request, post_list, posts_per_page)
+    paginator = CountedPaginator(post_list, posts_per_page, count_scope)
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
+
+
+def encode_cursor(direction, obj):
+    '''Упакует направление и позицию (pub_date, id) в непрозрачный токен.'''
+    raw = f'{direction}|{obj.pub_date.isoformat()}|{obj.pk}'
+    return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    '''
+    Распакует токен курсора в пару (направление, (pub_date, id)).
+    Пустой или поврежденный токен означает первую страницу.
+    '''
+    if not token:
+        return NEXT, None
+    try:
+        raw = urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        direction, pub_date, pk = raw.split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (DecodeError, UnicodeDecodeError, ValueError):
+        return NEXT, None
+    if direction not in (NEXT, PREVIOUS) or pub_date is None:
+        return NEXT, None
+    return direction, (pub_date, pk)
+
+
+class CursorPage:
+    '''
+    Страница курсорного паджинатора по ключу (pub_date, id). Не считает
+    общее количество записей, а знает только соседние страницы.
+    Запрос к базе выполняется при первом обращении к записям.
+    '''
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, direction=NEXT,
+                 position=None):
+        self.queryset = object_list
+        self.per_page = per_page
+        self.direction = direction
+        self.position = position
+
+    @cached_property
+    def _window(self):
+        queryset = self.queryset.order_by('-pub_date', '-id')
+        if self.position is not None:
+            pub_date, pk = self.position
+            if self.direction == NEXT:
+                queryset = queryset.filter(
+                    Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, id__gt=pk)
+                ).order_by('pub_date', 'id')
+        objects = list(queryset[:self.per_page + 1])
+        has_more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if self.direction == PREVIOUS:
+            objects.reverse()
+            return objects, True, has_more
+        return objects, has_more, self.position is not None
+
+    @property
+    def object_list(self):
+        return self._window[0]
+
+    def has_next(self):
+        return self._window[1] and bool(self.object_list)
+
+    def has_previous(self):
+        return self._window[2] and bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        if self.has_next():
+            return encode_cursor(NEXT, self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous():
+            return encode_cursor(PREVIOUS, self.object_list[0])
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __repr__(self):
+        return f'<CursorPage {self.direction} {self.position}>'
+
+
+def cursor_paginator(request, object_list, per_page=10):
+    '''
+    Вернет страницу курсорного паджинатора по ключу (pub_date, id) без
+    OFFSET и COUNT(*). Позиция передается токеном в параметре ?cursor=.
+    '''
+    direction, position = decode_cursor(request.GET.get('cursor'))
+    return CursorPage(object_list, per_page, direction, position)
@@ -1,11 +1,14 @@
+from django.conf import settings
+from django.db.models import F
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.http import Http404
 from django.core.exceptions import PermissionDenied
 
-from .models import Post, Group, User, Follow
+from .models import Post, Group, User, Follow, Comment
 from .forms import PostForm, CommentForm
-from .utils import paginator
+from .utils import CursorPage, cursor_paginator, paginator
+from . import caching, counters, feeds, search, thumbnails
 
 
 def index(request):
@@ -14,14 +17,29 @@ def index(request):
     по всем постам в базе данных.
     '''
     post_list = Post.objects.select_related('author', 'group')
-    page_obj = paginator(request, post_list)
+    page_obj = paginator(request, post_list, count_scope=counters.ALL)
     context = {
         'page_obj': page_obj,
+        **caching.feed_context(request, 'index'),
     }
 
     return render(request, 'posts/index.html', context)
 
 
+def search_posts(request):
+    '''
+    Направит на шаблон 'posts/search.html' с постами, найденными по
+    запросу ?q= в тексте постов и комментариев, от самых подходящих.
+    '''
+    query = request.GET.get('q', '').strip()
+    context = {
+        'page_obj': search.search(query, request.GET.get('cursor')),
+        'q': query,
+    }
+
+    return render(request, 'posts/search.html', context)
+
+
 def group_posts(request, slug):
     '''
     Направит на шаблон 'posts/group_list.html' с паджинатором
@@ -29,7 +47,8 @@ def group_posts(request, slug):
     '''
     group_object = get_object_or_404(Group, slug=slug)
     post_list = group_object.posts.select_related('author').all()
-    page_obj = paginator(request, post_list)
+    page_obj = paginator(request, post_list,
+                         count_scope=counters.group_scope(group_object.pk))
     context = {
         'group': group_object,
         'page_obj': page_obj,
@@ -38,6 +57,44 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+def tag_posts(request, tag):
+    '''
+    Направит на шаблон 'posts/tag_list.html' с паджинатором по постам с
+    хэштегом #tag, прочитанным из обратного индекса.
+    '''
+    tag = tag.lower()
+    post_list = Post.objects.filter(tags__tag=tag).select_related(
+        'author', 'group').order_by(F('tags__pub_date').desc(),
+                                    F('tags__post_id').desc())
+    page_obj = paginator(request, post_list,
+                         count_scope=counters.tag_scope(tag))
+    context = {
+        'heading': f'#{tag}',
+        'page_obj': page_obj,
+    }
+
+    return render(request, 'posts/tag_list.html', context)
+
+
+def mentions(request, username):
+    '''
+    Направит на шаблон 'posts/tag_list.html' с паджинатором по постам,
+    в которых упомянут пользователь username.
+    '''
+    user_object = get_object_or_404(User, username=username)
+    post_list = Post.objects.filter(mentions__user=user_object).select_related(
+        'author', 'group').order_by(F('mentions__pub_date').desc(),
+                                    F('mentions__post_id').desc())
+    page_obj = paginator(request, post_list,
+                         count_scope=counters.mentions_scope(user_object.pk))
+    context = {
+        'heading': f'Упоминания @{user_object.username}',
+        'page_obj': page_obj,
+    }
+
+    return render(request, 'posts/tag_list.html', context)
+
+
 def profile(request, username):
     '''
     Направит на шаблон 'posts/profile.html' с паджинатором
@@ -46,7 +103,13 @@ def profile(request, username):
     author_object = get_object_or_404(User, username=username)
     post_list = author_object.posts.select_related(
         'group', 'author').all()
-    page_obj = paginator(request, post_list)
+    counts = counters.get_counts((
+        counters.author_scope(author_object.pk),
+        counters.followers_scope(author_object.pk),
+        counters.following_scope(author_object.pk),
+    ))
+    page_obj = paginator(request, post_list,
+                         count_scope=counters.author_scope(author_object.pk))
     following = None
     if request.user.is_authenticated:
         following = Follow.objects.filter(user=request.user,
@@ -54,6 +117,11 @@ def profile(request, username):
     context = {
         'page_obj': page_obj,
         'author_object': author_object,
+        'count': counts[counters.author_scope(author_object.pk)],
+        'followers_count': counts[
+            counters.followers_scope(author_object.pk)],
+        'following_count': counts[
+            counters.following_scope(author_object.pk)],
         'following': following
     }
 
@@ -67,10 +135,11 @@ def post_detail(request, post_id):
     '''
     post_object = get_object_or_404(Post.objects.select_related(
         'group', 'author'), pk=post_id)
-    comments = post_object.comments.all()
+    comments = CursorPage(post_object.comments.select_related('author'),
+                          settings.COMMENTS_PER_PAGE)
     if post_object is None:
         raise Http404("Post does not exist")
-    count = post_object.author.posts.count()
+    count = counters.get_count(counters.author_scope(post_object.author_id))
     form = CommentForm(request.POST or None)
     context = {
         'post': post_object,
@@ -82,6 +151,23 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    '''
+    Вернет HTML-фрагмент со следующей страницей комментариев поста
+    post_id, начиная с курсора ?cursor=.
+    '''
+    get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author')
+    context = {
+        'comments': cursor_paginator(request, comments,
+                                     settings.COMMENTS_PER_PAGE),
+        'post_id': post_id,
+    }
+
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
 @login_required
 def post_create(request):
     '''
@@ -96,6 +182,7 @@ def post_create(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        thumbnails.enqueue(post.image)
         return redirect('posts:profile', post.author.username)
     context = {
         'form': form
@@ -120,7 +207,9 @@ def post_edit(request, post_id):
     if request.user != post_object.author:
         raise PermissionDenied
     if request.method == 'POST' and form.is_valid():
-        form.save()
+        post = form.save()
+        if 'image' in form.changed_data:
+            thumbnails.enqueue(post.image)
         return redirect('posts:post_detail', post_id)
 
     context = {
@@ -152,7 +241,7 @@ def follow_index(request):
     '''
     Покажет страницу с записями авторов, на которых подписан пользователь.
     '''
-    post_list = Post.objects.filter(author__following__user=request.user)
+    post_list = feeds.timeline(request.user)
     page_obj = paginator(request, post_list)
     context = {
         'page_obj': page_obj,
@@ -167,12 +256,8 @@ def profile_follow(request, username):
     базе данных.
     '''
     author_object = get_object_or_404(User, username=username)
-    if request.user == author_object \
-            or Follow.objects.filter(user=request.user,
-                                     author=author_object).exists():
-        return redirect('posts:follow_index')
-    new_follow = Follow(user=request.user, author=author_object)
-    new_follow.save()
+    if request.user != author_object:
+        Follow.objects.get_or_create(user=request.user, author=author_object)
     return redirect('posts:follow_index')
 
 
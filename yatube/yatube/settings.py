@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -52,6 +53,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.TracingMiddleware',
+    'core.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,7 +69,7 @@ ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backends.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -151,8 +155,77 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Кэш общий для всех процессов сайта и команд управления, иначе сбросы
+# карточек, счетчиков и ленты из команд и других воркеров сайт не увидит.
+# Таблицу кэша в базе создает команда createcachetable. Если на сервере есть
+# memcached, INNER_BACKEND стоит заменить на него.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.InstrumentedCache',
+        'INNER_BACKEND': 'core.cache.DatabaseCache',
+        'LOCATION': 'cache_table',
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
     }
 }
+
+# Представления, в которых вместо постраничного паджинатора используется
+# курсорный по (pub_date, id), например ['posts:index', 'posts:follow_index'].
+CURSOR_PAGINATION_VIEWS = []
+
+# Посты авторов, у которых подписчиков больше этого числа, не раскладываются
+# по лентам подписчиков, а читаются при показе ленты подписок.
+FEED_FANOUT_FOLLOWERS_LIMIT = 1000
+# Раскладка постов такого автора возобновляется, когда подписчиков остается
+# не больше этого числа. Зазор до FEED_FANOUT_FOLLOWERS_LIMIT не дает
+# авторам у границы переключаться туда и обратно при каждой подписке.
+FEED_FANOUT_RESUME_LIMIT = 900
+
+# Время жизни кэша страниц ленты. Кэш сбрасывается сигналами при изменении
+# постов и групп, поэтому может жить долго.
+FEED_CACHE_TIMEOUT = 60 * 5
+
+# Кэш отрисованных карточек постов. Версию нужно увеличить при изменении
+# шаблона includes/posts.html.
+POST_CARD_VERSION = 5
+POST_CARD_TIMEOUT = 60 * 60 * 24
+
+# Сколько комментариев показывать на странице поста и подгружать за раз.
+COMMENTS_PER_PAGE = 20
+
+# Сколько потоков выполняют фоновые задачи: создание миниатюр после загрузки
+# изображения и возобновление раскладки ленты. При нуле задачи выполняются
+# сразу после фиксации транзакции.
+THUMBNAIL_WORKERS = 2
+
+# Загрузки всегда пишутся во временный файл по частям, а не в память.
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Картинки больше IMAGE_MAX_PIXELS Pillow не декодирует, а с большей
+# стороной больше IMAGE_MAX_SIDE уменьшает до сохранения.
+IMAGE_MAX_PIXELS = 50 * 1000 * 1000
+IMAGE_MAX_SIDE = 2560
+
+# Показатели запросов каждый процесс сохраняет в свой файл в METRICS_DIR не
+# чаще раза в METRICS_FLUSH_INTERVAL секунд; /metrics складывает их. Каталог
+# стоит очищать при перезапуске сервиса.
+METRICS_DIR = os.path.join(tempfile.gettempdir(), 'yatube-metrics')
+METRICS_FLUSH_INTERVAL = 5
+
+# Доля запросов, которые трассируются. Трассировки в формате Chrome trace
+# (chrome://tracing, Perfetto) пишутся по одной в файл в TRACE_DIR.
+TRACE_SAMPLE_RATE = 0
+TRACE_DIR = os.path.join(tempfile.gettempdir(), 'yatube-traces')
+
+# Профилирование запросов: по заголовку X-Profile, подписанному командой
+# profile_token, или для доли PROFILE_SAMPLE_RATE запросов профилировщиком
+# PROFILE_MODE ('sampler' снимает стек раз в PROFILE_INTERVAL секунд,
+# 'cprofile' пишет pstats). Результаты сохраняются в PROFILE_DIR.
+PROFILE_SAMPLE_RATE = 0
+PROFILE_MODE = 'sampler'
+PROFILE_INTERVAL = 0.005
+PROFILE_TOKEN_MAX_AGE = 60 * 60
+PROFILE_DIR = os.path.join(tempfile.gettempdir(), 'yatube-profiles')